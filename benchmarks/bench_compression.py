@@ -0,0 +1,91 @@
+"""
+CPU time against bytes saved for each available encoding and level, on rendered templates and
+JSON payloads typical of this app. Sizes include the base64 encoding API Gateway requires for
+compressed bodies, so small bodies can come out larger than the identity response.
+
+First checks each encoding compresses the same content to the same bytes, so the ETags of
+cached view responses (see response_cache.py) survive a re-render.
+
+    python benchmarks/bench_compression.py
+"""
+import json
+import contextlib
+import io
+import sys
+from base64 import b64encode
+from time import sleep, time
+
+from common import timeit
+
+import compression
+import response_cache
+from config import COMPRESSION_MIN_SIZE
+from response_helper import format_response, render_template
+
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 5, 11), 'zstd': (1, 3, 19)}
+
+
+def claims(n: int):
+    return {
+        'aud': '00000000-0000-0000-0000-000000000000', 'iss': 'https://login.microsoftonline.com/tenant/v2.0',
+        'name': 'Test User', 'preferred_username': 'test.user@example.com', 'oid': 'a' * 36, 'tid': 'b' * 36,
+        'groups': [f"{i:08x}-0000-0000-0000-000000000000" for i in range(n)],
+    }
+
+
+def payloads():
+    user = claims(0)
+    yield 'redirect (empty body)', '', 'text/html'
+    yield 'index.html', render_template('index.html', user=user, config=__import__('config')), 'text/html'
+    yield 'auth_error.html', render_template('auth_error.html', result={'error': 'invalid_grant', 'error_description': 'x' * 400}), 'text/html'
+    yield 'auth_logged_out.html', render_template('auth_logged_out.html'), 'text/html'
+    for n in (10, 100, 1000):
+        yield f"json claims ({n} groups)", json.dumps(claims(n)), 'application/json'
+    yield 'json list (500 rows)', json.dumps([{'id': i, 'name': f"row {i}", 'value': i * 1.5, 'tags': ['a', 'b']} for i in range(500)]), 'application/json'
+
+
+class Session:
+    data = {'user': {'oid': 'user'}}
+    session_id = 'session'
+
+
+def render_etag(body: str, encoding: str):
+    """ the ETag response_cache gives a freshly rendered `body` """
+    response_cache.responses.clear()
+    request = {'method': 'GET', 'path': '/', 'querystring': ''}
+    response = {'id': 'check', 'accept-encoding': encoding, 'if-none-match': ''}
+    with contextlib.redirect_stdout(io.StringIO()):  # request logs
+        response_cache.serve(lambda req, res, s: format_response(res, body), 60, request, response, Session())
+    return response['headers']['ETag']
+
+
+def check():
+    body = render_template('index.html', user=claims(0), config=__import__('config')) * 10  # over COMPRESSION_MIN_SIZE
+    encodings = [e for e in compression.preference if e in compression.compressors] + ['identity']
+    first = {e: render_etag(body, e) for e in encodings}
+    sleep(1.1 - time() % 1)  # into the next second, which gzip used to write into its header
+    for encoding in encodings:
+        assert render_etag(body, encoding) == first[encoding], f"{encoding}: a re-render changed the ETag"
+
+
+def main():
+    check()
+    available = [e for e in compression.preference if e in compression.compressors]
+    print(f"encodings: {', '.join(available)}  (min size {COMPRESSION_MIN_SIZE} bytes)")
+    print(f"{'payload':<28} {'bytes':>7} {'encoding':>9} {'level':>5} {'sent':>7} {'saved':>7} {'us/op':>9}")
+    for name, body, content_type in payloads():
+        raw = body.encode('utf-8')
+        print(f"{name:<28} {len(raw):>7} {'identity':>9} {'':>5} {len(raw):>7} {0:>7} {'':>9}")
+        if not raw:
+            continue
+        for encoding in available:
+            for level in LEVELS.get(encoding, (compression.levels.get(encoding),)):
+                compressed = compression.compressors[encoding](raw, level)
+                sent = len(b64encode(compressed))
+                us = timeit(lambda: compression.compressors[encoding](raw, level), number=50, repeat=3)
+                print(f"{'':<28} {'':>7} {encoding:>9} {level:>5} {sent:>7} {len(raw) - sent:>7} {us:>9.1f}")
+    print(f"negotiate: {timeit(lambda: compression.negotiate('gzip, deflate, br;q=0.9, zstd;q=0.8'), number=10000):.2f} us")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
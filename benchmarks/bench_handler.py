@@ -0,0 +1,222 @@
+"""
+Offline load and latency benchmark of lambda_function.lambda_handler.
+
+Replays API Gateway 1.0 and 2.0 events for each route against an in-process DynamoDB and AAD
+(see fakes.py) and reports, per route:
+    - cold: import plus first request, each sample in a fresh interpreter
+    - warm: p50/p95/p99 latency over many requests in one interpreter
+    - allocations: peak traced memory and allocated blocks per warm request
+
+    python benchmarks/bench_handler.py [--requests 500] [--cold 5] [--version 2.0] [--session-backend cookie]
+    python benchmarks/bench_handler.py --save baseline.json
+    python benchmarks/bench_handler.py --baseline baseline.json --tolerance 0.25
+
+With --baseline, exits non-zero when any route's warm p95 (or cold p50) is more than
+`tolerance` slower than the baseline, to gate performance regressions.
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+from time import perf_counter, time
+from uuid import uuid4
+
+from common import SRC, percentiles
+
+import events
+import fakes
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROUTES = ('login', 'callback', 'static', 'view', '404', 'logout callback')
+TABLE = 'lambda_sessions'
+
+
+class Scenarios:
+    """ builds the event for each route, seeding the fake table with whatever that route needs """
+
+    def __init__(self, ddb: fakes.FakeDynamoDB, version: str, sessions: int = 1, backend: str = 'store'):
+        self.ddb = ddb
+        self.version = version
+        self.backend = backend
+        self.sessions = [uuid4().hex * 2 for _ in range(sessions)]  # logged in users, rotated through
+        self.n = 0
+        for session_id in self.sessions:
+            ddb.tables.setdefault(TABLE, {})[session_id] = events.session_item(session_id)
+        if backend == 'cookie':  # the same sessions, as the cookie the browser would send
+            user = {'name': 'Test User', 'preferred_username': 'test.user@example.com', 'oid': 'user'}
+            self.sessions = [self.cookie(s, 'null', {'user': user, 'referer': '/'}, checked=int(time())) for s in self.sessions]
+
+    def cookie(self, session_id: str, sid: str, data: dict, checked: int = None):
+        import lambda_function
+        from session_cookie import CookieSessionInterface
+        from session_dynamodb import DynamoDbSessionInterface
+        session = CookieSessionInterface(DynamoDbSessionInterface(TABLE), lambda_function.session_key)
+        session.session_id, session.session_state, session.data, session.checked = session_id, sid, data, checked
+        session._issue(3600)
+        return session.cookie_value()
+
+    def session(self):
+        self.n += 1
+        return self.sessions[self.n % len(self.sessions)]
+
+    def event(self, route: str):
+        v = self.version
+        if route == 'login':
+            return events.event('/auth/login', version=v, query={'referer': '%2F'})
+        if route == 'callback':
+            # the login cookie the login route set, AAD redirecting back with its state
+            import lambda_function
+            import login_state
+            state = login_state.new_state()
+            cookie = login_state.encode({'state': state, 'source_ip': events.SOURCE_IP, 'referer': '/'}, lambda_function.login_key)
+            return events.event('/auth/login/callback', version=v, cookies={'login': cookie},
+                                query={'code': 'code:user', 'state': state, 'session_state': f"sid-{state}"})
+        if route == 'static':
+            return events.event('/static/stylesheet.css', version=v, cookies={'session': self.session()})
+        if route == 'view':
+            return events.event('/', version=v, cookies={'session': self.session()})
+        if route == '404':
+            return events.event('/does/not/exist', version=v, cookies={'session': self.session()})
+        if route == 'logout callback':
+            # AAD single-sign-out: removes every session with the sid
+            session_id = uuid4().hex * 2
+            self.ddb.tables.setdefault(TABLE, {})[session_id] = events.session_item(session_id, sid='sid-logout')
+            return events.event('/auth/logout/callback', version=v, query={'sid': 'sid-logout'})
+        raise ValueError(route)
+
+
+def install_fakes(ddb_latency: float = 0.0, aad_latency: float = 0.0):
+    """ points the app at the fakes; must be called before the app first uses DynamoDB or msal """
+    import request_helper
+    import session_dynamodb
+    ddb = fakes.FakeDynamoDB(latency=ddb_latency)
+    session_dynamodb.ddb = ddb
+    request_helper.msal_http_client = fakes.FakeAuthority(latency=aad_latency)
+    # memory only, so the fake's discovery documents never reach the file the real app reads
+    request_helper.MSAL_DISCOVERY_CACHE_PATH = None
+    return ddb
+
+
+def invoke(handler, event):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):  # request logs
+        start = perf_counter()
+        response = handler(event, events.Context())
+        elapsed = perf_counter() - start
+    return response, elapsed * 1000
+
+
+def use_backend(backend: str):
+    import lambda_function
+    lambda_function.SESSION_BACKEND = backend
+
+
+def cold_sample(route: str, version: str, ddb_latency: float = 0.0, aad_latency: float = 0.0, backend: str = 'store'):
+    """ run in a fresh interpreter: import the app and time its first request """
+    start = perf_counter()
+    import lambda_function
+    imported = (perf_counter() - start) * 1000
+    use_backend(backend)
+    scenarios = Scenarios(install_fakes(ddb_latency, aad_latency), version, backend=backend)
+    response, first = invoke(lambda_function.lambda_handler, scenarios.event(route))
+    return {'import': imported, 'first': first, 'total': imported + first, 'status': response['statusCode']}
+
+
+def cold(route: str, version: str, samples: int, ddb_latency: float, aad_latency: float, backend: str):
+    code = (f"import json, sys; sys.path.insert(0, {BENCHMARKS!r}); import common, bench_handler; "
+            f"print(json.dumps(bench_handler.cold_sample({route!r}, {version!r}, {ddb_latency!r}, {aad_latency!r}, {backend!r})))")
+    env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    runs = []
+    for _ in range(samples):
+        out = subprocess.run([sys.executable, '-c', code], cwd=SRC, env=env, capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return runs
+
+
+def warm(route: str, scenarios: Scenarios, requests: int):
+    import lambda_function
+    handler = lambda_function.lambda_handler
+    for _ in range(min(requests, 20)):  # warm up
+        invoke(handler, scenarios.event(route))
+    latencies, status = [], None
+    for _ in range(requests):
+        response, ms = invoke(handler, scenarios.event(route))
+        latencies.append(ms)
+        status = response['statusCode']
+    # allocations, measured separately as tracing slows everything down
+    peaks, blocks = [], []
+    for _ in range(min(requests, 50)):
+        event = scenarios.event(route)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        invoke(handler, event)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        peaks.append(peak / 1024)
+        blocks.append(sum(s.count_diff for s in after.compare_to(before, 'filename') if s.count_diff > 0))
+    return latencies, peaks, blocks, status
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500, help='warm requests per route')
+    parser.add_argument('--cold', type=int, default=5, help='cold samples per route, 0 to skip')
+    parser.add_argument('--version', choices=('1.0', '2.0', 'both'), default='both')
+    parser.add_argument('--routes', default=','.join(ROUTES))
+    parser.add_argument('--sessions', type=int, default=1, help='logged in sessions to rotate through')
+    parser.add_argument('--ddb-latency-ms', type=float, default=0.0)
+    parser.add_argument('--aad-latency-ms', type=float, default=0.0)
+    parser.add_argument('--session-backend', choices=('store', 'cookie'), default='store')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with results saved by --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slow down against the baseline')
+    args = parser.parse_args()
+    ddb_latency, aad_latency = args.ddb_latency_ms / 1000, args.aad_latency_ms / 1000
+    versions = ('1.0', '2.0') if args.version == 'both' else (args.version,)
+    routes = [r.strip() for r in args.routes.split(',') if r.strip()]
+
+    ddb = install_fakes(ddb_latency, aad_latency)
+    use_backend(args.session_backend)
+    results = {}
+    print(f"{'route':<16} {'ver':>3} {'status':>6} {'cold p50':>9} {'warm p50':>9} {'p95':>8} {'p99':>8} {'peak KiB':>9} {'blocks':>7}")
+    for version in versions:
+        scenarios = Scenarios(ddb, version, args.sessions, args.session_backend)
+        for route in routes:
+            latencies, peaks, blocks, status = warm(route, scenarios, args.requests)
+            p50, p95, p99 = percentiles(latencies)
+            cold_p50 = None
+            if args.cold:
+                cold_p50, _, _ = percentiles([r['total'] for r in cold(route, version, args.cold, ddb_latency, aad_latency, args.session_backend)])
+            peak, _, _ = percentiles(peaks)
+            block, _, _ = percentiles(blocks)
+            results[f"{route} {version}"] = {'status': status, 'cold_p50': cold_p50, 'p50': p50, 'p95': p95, 'p99': p99,
+                                             'peak_kib': peak, 'blocks': block}
+            cold_s = f"{cold_p50:>9.2f}" if cold_p50 is not None else f"{'-':>9}"
+            print(f"{route:<16} {version:>3} {status:>6} {cold_s} {p50:>9.3f} {p95:>8.3f} {p99:>8.3f} {peak:>9.1f} {block:>7.0f}")
+    print(f"fake DynamoDB calls: {json.dumps(ddb.calls)}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = []
+        for key, r in results.items():
+            b = baseline.get(key)
+            if not b:
+                continue
+            for metric in ('p95', 'cold_p50'):
+                if r.get(metric) is not None and b.get(metric) and r[metric] > b[metric] * (1 + args.tolerance):
+                    failures.append(f"{key} {metric} {r[metric]:.3f} ms > baseline {b[metric]:.3f} ms")
+        for failure in failures:
+            print(f"REGRESSION: {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Time and peak memory of parsing multipart/form-data bodies with parse_request, from a few KB up
+to the 10MB API Gateway limit, against the original string splitting parser. The original can't
+parse binary uploads, so it is given text file content.
+
+    python benchmarks/bench_multipart.py
+"""
+import re
+import sys
+import tracemalloc
+from base64 import b64decode, b64encode
+from time import perf_counter
+
+from common import timeit
+
+from request_helper import parse_request
+
+SIZES = (4 * 1024, 64 * 1024, 1024 * 1024, 5 * 1024 * 1024, 10 * 1024 * 1024 - 4096)
+BOUNDARY = '----WebKitFormBoundary7MA4YWxkTrZu0gW'
+
+
+class Context:
+    aws_request_id = 'benchmark'
+
+
+def body(size: int, binary: bool):
+    content = (bytes(range(256)) if binary else b'0123456789abcdef' * 16) * (size // 256 + 1)
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nupload\r\n"
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"upload.bin\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode() + content[:size] + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def event(raw: bytes):
+    return {
+        'version': '2.0', 'rawPath': '/upload', 'body': b64encode(raw).decode(), 'isBase64Encoded': True,
+        'headers': {'content-type': f"multipart/form-data; boundary={BOUNDARY}"},
+        'requestContext': {'domainName': 'localhost', 'stage': '$default', 'http': {'method': 'POST', 'sourceIp': '127.0.0.1'}},
+    }
+
+
+def original(e):
+    """ the string based parser parse_request used before """
+    form_data = {}
+    content_type = e['headers']['content-type']
+    data = b64decode(e['body'].encode('utf-8')).decode('utf-8')
+    boundary = re.search(r'boundary=("[^"]+"|[^ ]+)', content_type, flags=re.IGNORECASE).group(1).strip('" ')
+    for b in ('\r\n' + data).split('\r\n--' + boundary):
+        if not b or b.startswith('--'): continue
+        h, c = b.split('\r\n' * 2, 1)
+        hk, hv = h.split(':', 1)
+        lines = hv.split('\r\n')
+        f = {k.strip().lower(): v.strip('" ') for k, v in (d.split('=', 1) for d in lines[0].split(';') if '=' in d)}
+        form_data[f['name']] = c if 'filename' not in f else {'filename': f['filename'], 'content': c}
+    return form_data
+
+
+def measure(fn, e):
+    tracemalloc.start()
+    start = perf_counter()
+    fn(e)
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak
+
+
+def main():
+    print(f"{'size':>10} {'parser':>9} {'ms':>8} {'peak MB':>8} {'peak/size':>9}")
+    for size in SIZES:
+        for name, fn, binary in (('original', original, False), ('bytes', lambda e: parse_request(e, Context()), True)):
+            e = event(body(size, binary))
+            ms = timeit(lambda: fn(e), number=3, repeat=3) / 1000
+            _, peak = measure(fn, e)
+            print(f"{size:>10} {name:>9} {ms:>8.2f} {peak / 1e6:>8.2f} {peak / size:>9.2f}")
+    # binary content must survive the round trip
+    raw = body(SIZES[1], True)
+    form = parse_request(event(raw), Context())['form_data']
+    assert bytes(form['file']['content']) == raw[raw.index(b'\r\n\r\n', raw.index(b'filename')) + 4:-len(f"\r\n--{BOUNDARY}--\r\n")]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Compares single-sign-out purges: the original one page query plus a DeleteItem per session, with
+the paginated, batched and concurrent DynamoDbSessionInterface.purge, against a FakeDynamoDB with
+simulated latency, 1MB pages and throttling. Also times sweep_expired.
+
+    python benchmarks/bench_purge.py [--sessions 10,100,1000] [--latency-ms 5] [--page-size 100] [--unprocessed 0.1]
+"""
+import argparse
+import sys
+from time import perf_counter, time
+from uuid import uuid4
+
+import common  # noqa: F401 (sys.path)
+import events
+import fakes
+
+import session_dynamodb
+from session_dynamodb import DynamoDbSessionInterface
+
+TABLE = 'lambda_sessions'
+
+
+def seed(ddb: fakes.FakeDynamoDB, sessions: int, sid: str = 'sid-purge', ttl: int = 3600):
+    table = ddb.tables.setdefault(TABLE, {})
+    table.clear()
+    for _ in range(sessions):
+        session_id = uuid4().hex * 2
+        table[session_id] = events.session_item(session_id, sid=sid, ttl=ttl)
+
+
+def serial(ddb: fakes.FakeDynamoDB, sid: str):
+    """ the original delete_sid: one query page and a DeleteItem per session """
+    response = ddb.query(
+        TableName=TABLE,
+        IndexName='sid-index',
+        KeyConditionExpression='sid=:sid',
+        ExpressionAttributeValues={":sid": {"S": sid}})
+    for item in response['Items']:
+        ddb.delete_item(TableName=TABLE, Key={"id": {"S": item['id']['S']}})
+
+
+def run(ddb: fakes.FakeDynamoDB, sessions: int, fn):
+    seed(ddb, sessions)
+    ddb.calls.clear()
+    start = perf_counter()
+    fn()
+    elapsed = (perf_counter() - start) * 1000
+    return elapsed, sum(ddb.calls.values()), len(ddb.tables[TABLE])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', default='10,100,1000')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='simulated round trip per call')
+    parser.add_argument('--page-size', type=int, default=100, help='items per query/scan page')
+    parser.add_argument('--unprocessed', type=float, default=0.1, help='fraction of batch writes throttled')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    ddb = fakes.FakeDynamoDB(latency=args.latency_ms / 1000, page_size=args.page_size, unprocessed=args.unprocessed)
+    session_dynamodb.ddb = ddb
+    session = DynamoDbSessionInterface(TABLE, batch_workers=args.workers)
+    print(f"{'sessions':>8} {'method':<14} {'ms':>9} {'calls':>6} {'left':>6}")
+    for n in (int(x) for x in args.sessions.split(',')):
+        for name, fn in (('serial', lambda: serial(ddb, 'sid-purge')),
+                         ('purge', lambda: session.purge(['sid-purge'])),
+                         ('sweep_expired', lambda: session.sweep_expired(int(time()) + 7200))):
+            ms, calls, left = run(ddb, n, fn)
+            print(f"{n:>8} {name:<14} {ms:>9.1f} {calls:>6} {left:>6}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
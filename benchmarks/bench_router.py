@@ -0,0 +1,70 @@
+"""
+Compares view dispatch by walking the views directory (the original lambda_handler loop) with the
+precompiled Router trie, on generated view trees of increasing depth.
+
+    python benchmarks/bench_router.py [--depth 8] [--fanout 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from common import timeit
+
+from config import DEFAULT_VIEW
+from router import Router
+
+
+def build_tree(root: str, depth: int, fanout: int):
+    """ views/d0/d1/.../dN with `fanout` sibling files at every level and a default view at the bottom """
+    path = root
+    for d in range(depth):
+        for f in range(fanout):
+            open(os.path.join(path, f"page{f}.py"), 'w').write("def view(request, response, session): pass\n")
+        path = os.path.join(path, f"d{d}")
+        os.mkdir(path)
+    open(os.path.join(path, DEFAULT_VIEW + '.py'), 'w').write("def view(request, response, session): pass\n")
+
+
+def walk(base: str, path: str):
+    """ the per-request filesystem walk the Router replaces """
+    f = '/views'
+    for p in path.split('/')[1:]:
+        if not p: continue
+        f += '/' + p
+        if os.path.isdir(base + f):
+            continue
+        if os.path.isfile(base + f + '.py'):
+            return f
+    else:
+        f += '/' + DEFAULT_VIEW
+        if os.path.isfile(base + f + '.py'):
+            return f
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--depth', type=int, default=8)
+    parser.add_argument('--fanout', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as base:
+        views = os.path.join(base, 'views')
+        os.mkdir(views)
+        build_tree(views, args.depth, args.fanout)
+        print(f"{'depth':>5} {'walk us':>10} {'trie us':>10} {'speedup':>8}")
+        router = Router(views)
+        for depth in range(0, args.depth + 1):
+            path = ''.join(f"/d{d}" for d in range(depth)) + ('/page0' if depth < args.depth else '')
+            expected = walk(base, path)
+            route, _ = router.resolve(path)
+            assert route is not None and route.path == expected, (path, route, expected)
+            t_walk = timeit(lambda: walk(base, path), number=2000)
+            t_trie = timeit(lambda: router.resolve(path), number=2000)
+            print(f"{depth:>5} {t_walk:>10.2f} {t_trie:>10.2f} {t_walk / t_trie:>7.1f}x")
+        print(f"cold start scan: {timeit(lambda: Router(views), number=20, repeat=3):.1f} us")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
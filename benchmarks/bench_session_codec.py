@@ -0,0 +1,78 @@
+"""
+Stored item size, write units and encode/decode time of session data written as a native
+DynamoDB map (TypeSerializer) and with each session_codec, for sessions typical of this app.
+
+    python benchmarks/bench_session_codec.py
+"""
+import math
+import sys
+from decimal import Decimal
+from time import time
+
+from common import timeit
+
+import session_codec
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+
+def claims(groups: int):
+    now = int(time())
+    return {
+        'aud': '00000000-0000-0000-0000-000000000000', 'iss': 'https://login.microsoftonline.com/tenant/v2.0',
+        'iat': now, 'nbf': now, 'exp': now + 3600, 'name': 'Test User', 'preferred_username': 'test.user@example.com',
+        'oid': 'a' * 36, 'sub': 'b' * 43, 'tid': 'c' * 36, 'sid': 'd' * 36, 'ver': '2.0', 'rh': 'e' * 40,
+        'roles': ['Reader', 'Writer'], 'groups': [f"{i:08x}-0000-0000-0000-000000000000" for i in range(groups)],
+    }
+
+
+def payloads():
+    yield 'login (source ip, referer)', {'source_ip': '203.0.113.10', 'referer': '/'}
+    for groups in (0, 20, 200):
+        yield f"user ({groups} groups)", {'source_ip': '203.0.113.10', 'referer': '/', 'user': claims(groups)}
+
+
+def size(value: dict):
+    """ bytes DynamoDB bills for an attribute value, see 'Item size' in the DynamoDB developer guide """
+    (kind, v), = value.items()
+    if kind == 'S':
+        return len(v.encode('utf-8'))
+    if kind == 'B':
+        return len(v)
+    if kind == 'N':
+        return math.ceil(len(v.lstrip('-').replace('.', '').strip('0') or '0') / 2) + 1
+    if kind in ('BOOL', 'NULL'):
+        return 1
+    if kind == 'M':
+        return 3 + sum(1 + len(k.encode('utf-8')) + size(x) for k, x in v.items())
+    if kind == 'L':
+        return 3 + sum(1 + size(x) for x in v)
+    raise ValueError(kind)
+
+
+def item_size(data_attribute: dict):
+    now = int(time())
+    item = {'id': {'S': 'f' * 128}, 'sid': {'S': 'd' * 36}, 'modified': {'N': str(now)}, 'ttl': {'N': str(now + 3600)},
+            'data': data_attribute}
+    return sum(len(k) + size(v) for k, v in item.items())
+
+
+def main():
+    serializer, deserializer = TypeSerializer(), TypeDeserializer()
+    default = lambda o: float(o) if isinstance(o, Decimal) else str(o)
+    print(f"{'payload':<28} {'codec':<13} {'item bytes':>10} {'WCU':>4} {'encode us':>10} {'decode us':>10}")
+    for name, data in payloads():
+        native = serializer.serialize(data)
+        n_size = item_size(native)
+        print(f"{name:<28} {'native map':<13} {n_size:>10} {math.ceil(n_size / 1024):>4} "
+              f"{timeit(lambda: serializer.serialize(data), 2000):>10.1f} {timeit(lambda: deserializer.deserialize(native), 2000):>10.1f}")
+        for codec in session_codec.codecs:
+            blob = session_codec.encode(data, codec, default=default)
+            c_size = item_size({'B': blob})
+            print(f"{'':<28} {codec:<13} {c_size:>10} {math.ceil(c_size / 1024):>4} "
+                  f"{timeit(lambda: session_codec.encode(data, codec, default=default), 2000):>10.1f} "
+                  f"{timeit(lambda: session_codec.decode(blob), 2000):>10.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Latency of the session operations a request makes, for each session store: open (as every
+authenticated request does), touch, save, the token cache fetch and single-sign-out.
+
+    python benchmarks/bench_session_store.py [--stores memory,dynamodb,redis] [--redis-url redis://localhost:6379/0]
+
+`dynamodb` runs against the in-process FakeDynamoDB (with --ddb-latency-ms to stand in for the
+network). `redis` needs the redis package and a server, eg. `redis-server` or
+`docker run -p 6379:6379 redis`; it also checks the store's behaviour so doubles as its test.
+"""
+import argparse
+import sys
+from time import perf_counter
+from uuid import uuid4
+
+from common import percentiles
+
+import fakes
+
+import session_dynamodb
+import session_memory
+import session_redis
+
+USER = {'name': 'Test User', 'preferred_username': 'test.user@example.com', 'oid': 'user'}
+
+
+def new(store: str, args):
+    if store == 'redis':
+        return session_redis.RedisSessionInterface(args.redis_url, prefix='bench-session:', sid_prefix='bench-session-sid:')
+    if store == 'dynamodb':
+        return session_dynamodb.DynamoDbSessionInterface(codec='json+zlib')
+    return session_memory.MemorySessionInterface()
+
+
+def check(store: str, args):
+    """ the behaviour the handler relies on, whatever the store """
+    s = new(store, args).create({'referer': '/'}).save(60)
+    assert s.cookie_changed, 'a new session sends its cookie'
+    session_id = s.session_id
+    s = new(store, args).open(session_id)
+    assert s.session_id == session_id and s.data == {'referer': '/'} and not s.is_dirty
+    s.session_state, s.data['user'] = f"sid-{session_id}", USER
+    s.set_token_cache('{"AccessToken": {}}')
+    s.save(60)
+    s = new(store, args).open(session_id)
+    assert s.data['user'] == USER and not s.token_cache_loaded
+    assert s.get_token_cache() == '{"AccessToken": {}}'
+    s.modified -= 600
+    s.touch(60, 300)
+    assert s.session_id == session_id, 'touch keeps an existing session'
+    assert new(store, args).delete_sid(f"sid-{session_id}") == 1
+    assert new(store, args).open(session_id).session_id != session_id, 'single-sign-out deletes it'
+    s.modified -= 600
+    assert s.touch(60, 300).session_id is None, 'touching a deleted session clears it'
+
+
+def measure(store: str, args):
+    ids = []
+    for _ in range(args.sessions):
+        s = new(store, args).create({'user': USER, 'referer': '/'})
+        s.session_state = f"sid-{uuid4().hex}"
+        s.set_token_cache('{"AccessToken": {}}' * 50)
+        ids.append(s.save(3600).session_id)
+    timings = {'open': [], 'touch': [], 'save': [], 'token cache': []}
+    for i in range(args.requests):
+        session_id = ids[i % len(ids)]
+        start = perf_counter()
+        s = new(store, args).open(session_id)
+        timings['open'].append((perf_counter() - start) * 1000)
+        start = perf_counter()
+        s.touch(3600, 0)
+        timings['touch'].append((perf_counter() - start) * 1000)
+        s.data['n'] = i
+        start = perf_counter()
+        s.save(3600)
+        timings['save'].append((perf_counter() - start) * 1000)
+        start = perf_counter()
+        s.get_token_cache()
+        timings['token cache'].append((perf_counter() - start) * 1000)
+    for session_id in ids:
+        new(store, args).delete(session_id)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stores', default='memory,dynamodb,redis')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--ddb-latency-ms', type=float, default=0.0)
+    parser.add_argument('--redis-url', default='redis://localhost:6379/0')
+    args = parser.parse_args()
+    session_dynamodb.ddb = fakes.FakeDynamoDB(latency=args.ddb_latency_ms / 1000)
+
+    print(f"{'store':<10} {'operation':<12} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for store in (s.strip() for s in args.stores.split(',') if s.strip()):
+        if store == 'redis':
+            try:
+                session_redis.get_redis(args.redis_url).ping()
+            except Exception as e:
+                print(f"{store:<10} skipped: {e}")
+                continue
+        check(store, args)
+        for operation, samples in measure(store, args).items():
+            p50, p95, p99 = percentiles(samples)
+            print(f"{store:<10} {operation:<12} {p50:>8.3f} {p95:>8.3f} {p99:>8.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Cold start cost of the first render_template, with and without templates precompiled by
+response_helper.compile_templates. Each sample is a fresh interpreter, as in a new container.
+
+    python benchmarks/bench_templates.py [--samples 15]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from common import SRC, percentiles
+
+from config import COMPILED_TEMPLATES_PATH
+
+CHILD = '''
+import json, sys
+from time import perf_counter
+sys.path.insert(0, "benchmarks")
+import common
+import config
+import response_helper
+response_helper.get_assets()  # static_url() builds the asset manifest, keep it out of the timings
+t1 = perf_counter()
+response_helper.render_template("index.html", user={"name": "Test User"}, config=config)
+t2 = perf_counter()
+response_helper.render_template("index.html", user={"name": "Test User"}, config=config)
+t3 = perf_counter()
+print(json.dumps({"first": t2 - t1, "second": t3 - t2}))
+'''
+
+
+def run(samples: int):
+    results = {'first': [], 'second': []}
+    for _ in range(samples):
+        out = subprocess.run([sys.executable, '-c', CHILD], check=True, capture_output=True, text=True,
+                             cwd=os.path.dirname(SRC), env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'})
+        for k, v in json.loads(out.stdout.strip().splitlines()[-1]).items():
+            results[k].append(v * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=15)
+    args = parser.parse_args()
+
+    target = SRC + COMPILED_TEMPLATES_PATH
+    existed = os.path.isdir(target)
+    backup = target + '.bak'
+    if existed:
+        shutil.move(target, backup)
+    try:
+        print(f"{'templates':<12} {'phase':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for label in ('filesystem', 'compiled'):
+            if label == 'compiled':
+                import response_helper
+                response_helper.compile_templates(target)
+            for phase, samples in run(args.samples).items():
+                p50, p95, p99 = percentiles(samples)
+                print(f"{label:<12} {phase:<8} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f}")
+    finally:
+        shutil.rmtree(target, ignore_errors=True)
+        if existed:
+            shutil.move(backup, target)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+""" Shared set-up for the benchmark scripts: makes `src` importable without AWS/AAD settings. """
+import os
+import sys
+from statistics import quantiles
+from time import perf_counter
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+os.environ.setdefault('AUTHORITY', 'https://login.microsoftonline.com/00000000-0000-0000-0000-000000000000')
+os.environ.setdefault('CLIENT_ID', '00000000-0000-0000-0000-000000000000')
+os.environ.setdefault('CLIENT_SECRET', 'benchmark')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+
+
+def timeit(fn, number: int = 1000, repeat: int = 5):
+    """ best of `repeat` runs, in microseconds per call """
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, perf_counter() - start)
+    return best / number * 1e6
+
+
+def percentiles(samples: list):
+    """ p50, p95, p99 of the samples """
+    if len(samples) < 2:
+        return (samples[0],) * 3 if samples else (0.0,) * 3
+    q = quantiles(samples, n=100, method='inclusive')
+    return q[49], q[94], q[98]
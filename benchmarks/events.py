@@ -0,0 +1,87 @@
+"""
+API Gateway proxy event fixtures (payload format 1.0 and 2.0) and a minimal Lambda context.
+"""
+import json
+from base64 import b64encode
+from time import time
+from urllib.parse import urlencode
+from uuid import uuid4
+
+DOMAIN = 'abcdefghij.execute-api.eu-west-1.amazonaws.com'
+SOURCE_IP = '203.0.113.10'
+
+
+class Context:
+    function_name = 'benchmark'
+    memory_limit_in_mb = 512
+
+    def __init__(self):
+        self.aws_request_id = str(uuid4())
+
+    def get_remaining_time_in_millis(self):
+        return 60000
+
+
+def event(path: str, method: str = 'GET', version: str = '2.0', query: dict = None, cookies: dict = None,
+          headers: dict = None, body=None, content_type: str = None, source_ip: str = SOURCE_IP):
+    """ builds the event API Gateway sends for a request. `body` may be bytes, str or a dict (sent as JSON). """
+    headers = {
+        'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'accept-encoding': 'gzip, deflate, br',
+        'host': DOMAIN,
+        'user-agent': 'Mozilla/5.0 (benchmark)',
+        'x-forwarded-for': source_ip,
+        'x-forwarded-port': '443',
+        'x-forwarded-proto': 'https',
+        **(headers or {})
+    }
+    is_base64_encoded = False
+    if isinstance(body, dict):
+        body, content_type = json.dumps(body), content_type or 'application/json'
+    if isinstance(body, bytes):
+        body, is_base64_encoded = b64encode(body).decode('utf-8'), True
+    if content_type:
+        headers['content-type'] = content_type
+    now = int(time() * 1000)
+    if version == '1.0':
+        if cookies:
+            headers['cookie'] = '; '.join(f"{k}={v}" for k, v in cookies.items())
+        return {
+            'version': '1.0', 'resource': '/{proxy+}', 'path': path, 'httpMethod': method,
+            'headers': headers, 'multiValueHeaders': {k: [v] for k, v in headers.items()},
+            'queryStringParameters': query or None, 'pathParameters': {'proxy': path.lstrip('/')},
+            'requestContext': {
+                'accountId': '123456789012', 'apiId': 'abcdefghij', 'domainName': DOMAIN,
+                'httpMethod': method, 'path': path, 'protocol': 'HTTP/1.1', 'requestId': str(uuid4()),
+                'requestTimeEpoch': now, 'stage': '$default', 'identity': {'sourceIp': source_ip},
+            },
+            'body': body, 'isBase64Encoded': is_base64_encoded,
+        }
+    event = {
+        'version': '2.0', 'routeKey': 'ANY /{proxy+}', 'rawPath': path,
+        'rawQueryString': urlencode(query or {}), 'headers': headers,
+        'requestContext': {
+            'accountId': '123456789012', 'apiId': 'abcdefghij', 'domainName': DOMAIN,
+            'domainPrefix': 'abcdefghij', 'requestId': str(uuid4()), 'routeKey': 'ANY /{proxy+}',
+            'stage': '$default', 'time': '', 'timeEpoch': now,
+            'http': {'method': method, 'path': path, 'protocol': 'HTTP/1.1', 'sourceIp': source_ip, 'userAgent': headers['user-agent']},
+        },
+        'isBase64Encoded': is_base64_encoded,
+    }
+    if query:
+        event['queryStringParameters'] = query
+    if cookies:
+        event['cookies'] = [f"{k}={v}" for k, v in cookies.items()]
+    if body is not None:
+        event['body'] = body
+    return event
+
+
+def session_item(session_id: str, user: dict = None, sid: str = 'null', ttl: int = 3600):
+    """ a logged in session as stored in DynamoDB, for seeding a FakeDynamoDB """
+    now = int(time())
+    user = user or {'name': 'Test User', 'preferred_username': 'test.user@example.com', 'oid': 'user'}
+    return {
+        'id': {'S': session_id}, 'sid': {'S': sid}, 'modified': {'N': str(now)}, 'ttl': {'N': str(now + ttl)},
+        'data': {'M': {'user': {'M': {k: {'S': v} for k, v in user.items()}}, 'referer': {'S': '/'}}},
+    }
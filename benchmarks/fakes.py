@@ -0,0 +1,216 @@
+"""
+In-process stand-ins for the services the app calls, so it can be measured without deploying.
+
+    import session_dynamodb, request_helper
+    session_dynamodb.ddb = FakeDynamoDB()
+    request_helper.get_msal_app(FakeAuthority())
+"""
+import json
+from base64 import urlsafe_b64encode
+from copy import deepcopy
+from random import random
+from threading import Lock
+from time import sleep, time
+
+TENANT = '00000000-0000-0000-0000-000000000000'
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class FakeDynamoDB:
+    """ The subset of the boto3 DynamoDB client used by session_dynamodb, on a dict.
+
+    :param latency: seconds added to every call, to stand in for the network round trip
+    :param page_size: items per query/scan page, standing in for DynamoDB's 1MB page limit
+    :param unprocessed: fraction of batch writes returned as UnprocessedItems, as when throttled
+    """
+
+    def __init__(self, latency: float = 0.0, key: str = 'id', page_size: int = None, unprocessed: float = 0.0):
+        self.latency = latency
+        self.key = key
+        self.page_size = page_size
+        self.unprocessed = unprocessed
+        self.tables = {}  # table: {key: item}
+        self.calls = {}  # operation: count
+        self._lock = Lock()
+        self.exceptions = type('exceptions', (), {'ConditionalCheckFailedException': ConditionalCheckFailedException})
+
+    def _call(self, operation: str, table: str):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            sleep(self.latency)
+        return self.tables.setdefault(table, {})
+
+    def _key(self, key: dict):
+        return key[self.key]['S']
+
+    def get_item(self, TableName, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        item = self._call('get_item', TableName).get(self._key(Key))
+        if item is None:
+            return {}
+        if ProjectionExpression:
+            names = ExpressionAttributeNames or {}
+            attrs = [names.get(a.strip(), a.strip()) for a in ProjectionExpression.split(',')]
+            item = {k: v for k, v in item.items() if k in attrs}
+        return {'Item': deepcopy(item)}
+
+    def put_item(self, TableName, Item, **kwargs):
+        self._call('put_item', TableName)[self._key(Item)] = deepcopy(Item)
+        return {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+                    ConditionExpression=None, **kwargs):
+        # only 'SET a = :x, b = :y REMOVE c, d.e' updates and an 'attribute_exists(key)' condition are supported
+        table = self._call('update_item', TableName)
+        key = self._key(Key)
+        if ConditionExpression and key not in table:
+            raise ConditionalCheckFailedException('The conditional request failed')
+        names = ExpressionAttributeNames or {}
+        item = table.setdefault(key, deepcopy(Key))
+        expression, _, remove = UpdateExpression.partition(' REMOVE ')
+        for assignment in expression.strip()[len('SET '):].split(','):
+            attr, placeholder = (x.strip() for x in assignment.split('='))
+            item[names.get(attr, attr)] = deepcopy(ExpressionAttributeValues[placeholder])
+        for path in filter(None, (x.strip() for x in remove.split(','))):
+            *parents, attr = [names.get(p, p) for p in path.split('.')]
+            target = item
+            for parent in parents:
+                target = target.get(parent, {}).get('M', {})
+            target.pop(attr, None)
+        return {}
+
+    def delete_item(self, TableName, Key, **kwargs):
+        self._call('delete_item', TableName).pop(self._key(Key), None)
+        return {}
+
+    def _page(self, items: list, limit: int, start_key: dict):
+        start = 0
+        if start_key:
+            keys = [self._key(i) for i in items]
+            start = keys.index(self._key(start_key)) + 1
+        limit = min(x for x in (limit, self.page_size, len(items) - start) if x is not None)
+        page = items[start:start + limit]
+        response = {'Items': page, 'Count': len(page)}
+        if start + limit < len(items):
+            response['LastEvaluatedKey'] = {self.key: page[-1][self.key]}
+        return response
+
+    def query(self, TableName, IndexName, KeyConditionExpression, ExpressionAttributeValues, Limit=None, ExclusiveStartKey=None, **kwargs):
+        # only the 'attr=:value' conditions used by this app are supported
+        attr, placeholder = (x.strip() for x in KeyConditionExpression.split('='))
+        value = ExpressionAttributeValues[placeholder]
+        table = self._call('query', TableName)
+        items = [{self.key: i[self.key], attr: i[attr]} for i in list(table.values()) if i.get(attr) == value]  # KEYS_ONLY
+        return self._page(items, Limit, ExclusiveStartKey)
+
+    def scan(self, TableName, FilterExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+             ProjectionExpression=None, Limit=None, ExclusiveStartKey=None, **kwargs):
+        # only '<attr> <op> :value' filters on number attributes are supported
+        items = list(self._call('scan', TableName).values())
+        if FilterExpression:
+            attr, op, placeholder = FilterExpression.split()
+            attr = (ExpressionAttributeNames or {}).get(attr, attr)
+            value = float(ExpressionAttributeValues[placeholder]['N'])
+            test = {'<': float.__lt__, '<=': float.__le__, '>': float.__gt__, '>=': float.__ge__, '=': float.__eq__}[op]
+            items = [i for i in items if attr in i and test(float(i[attr]['N']), value)]
+        if ProjectionExpression:
+            attrs = [(ExpressionAttributeNames or {}).get(a.strip(), a.strip()) for a in ProjectionExpression.split(',')]
+            items = [{k: v for k, v in i.items() if k in attrs} for i in items]
+        return self._page(items, Limit, ExclusiveStartKey)
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        unprocessed = {}
+        for table_name, requests in RequestItems.items():
+            if len(requests) > 25:
+                raise ValueError('Too many items requested for the BatchWriteItem call')
+            table = self._call('batch_write_item', table_name)
+            for request in requests:
+                if self.unprocessed and random() < self.unprocessed:
+                    unprocessed.setdefault(table_name, []).append(request)
+                elif 'DeleteRequest' in request:
+                    table.pop(self._key(request['DeleteRequest']['Key']), None)
+                else:
+                    item = request['PutRequest']['Item']
+                    table[self._key(item)] = deepcopy(item)
+        return {'UnprocessedItems': unprocessed}
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, payload: dict):
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+        self.headers = {'Content-Type': 'application/json'}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"{self.status_code} Error")
+
+
+def b64(d: dict):
+    return urlsafe_b64encode(json.dumps(d).encode('utf-8')).decode('utf-8').rstrip('=')
+
+
+class FakeAuthority:
+    """ An msal http client answering for login.microsoftonline.com: discovery and the token endpoint.
+
+    :param latency: seconds added to every call, to stand in for the network round trip
+    :param home_tenant: the users' own tenant, when they are guests in `tenant`
+    """
+
+    def __init__(self, client_id: str = TENANT, tenant: str = TENANT, latency: float = 0.0, home_tenant: str = None):
+        self.client_id = client_id
+        self.tenant = tenant
+        self.home_tenant = home_tenant or tenant
+        self.latency = latency
+        self.base = f"https://login.microsoftonline.com/{tenant}"
+        self.calls = {}  # url path: count
+        self.issued = 0
+
+    def _call(self, url: str):
+        path = url.split('login.microsoftonline.com', 1)[-1].split('?', 1)[0]
+        self.calls[path] = self.calls.get(path, 0) + 1
+        if self.latency:
+            sleep(self.latency)
+
+    def get(self, url, params=None, **kwargs):
+        self._call(url)
+        if url.endswith('/.well-known/openid-configuration'):
+            return FakeResponse(200, {
+                'authorization_endpoint': f"{self.base}/oauth2/v2.0/authorize",
+                'token_endpoint': f"{self.base}/oauth2/v2.0/token",
+                'end_session_endpoint': f"{self.base}/oauth2/v2.0/logout",
+                'issuer': f"{self.base}/v2.0",
+            })
+        if url.endswith('/common/discovery/instance'):
+            return FakeResponse(200, {'tenant_discovery_endpoint': f"{self.base}/v2.0/.well-known/openid-configuration"})
+        return FakeResponse(404, {'error': 'not_found'})
+
+    def post(self, url, data=None, headers=None, **kwargs):
+        self._call(url)
+        data = data or {}
+        if data.get('code') == 'invalid' or data.get('refresh_token') == 'invalid':
+            return FakeResponse(400, {'error': 'invalid_grant', 'error_description': 'AADSTS70000: invalid grant'})
+        self.issued += 1
+        now = int(time())
+        grant = data.get('code') or data.get('refresh_token') or ''  # 'code:<oid>' picks the user
+        oid = grant.rpartition(':')[2] if ':' in grant else 'user'
+        claims = {
+            'aud': self.client_id, 'iss': f"{self.base}/v2.0", 'iat': now, 'nbf': now, 'exp': now + 3600,
+            'name': f"Test {oid}", 'preferred_username': f"{oid}@example.com",
+            'oid': oid, 'tid': self.tenant, 'sub': oid, 'sid': f"sid-{oid}", 'ver': '2.0',
+        }
+        return FakeResponse(200, {
+            'token_type': 'Bearer',
+            'scope': data.get('scope', 'openid profile offline_access'),
+            'expires_in': 3600, 'ext_expires_in': 3600,
+            'access_token': f"access-token-{self.issued}",
+            'refresh_token': f"refresh-token:{oid}",
+            'id_token': f"{b64({'alg': 'none', 'typ': 'JWT'})}.{b64(claims)}.",
+            'client_info': b64({'uid': oid, 'utid': self.home_tenant}),
+        })
@@ -0,0 +1,126 @@
+"""
+Cold start profile of the Lambda entry point, for catching regressions in CI.
+
+1. `python -X importtime -c "import lambda_function"`, summarised by top level package
+2. for each route, a fresh interpreter times the import and the first request, and lists the
+   heavy dependencies that request had to import
+
+    python benchmarks/profile_cold_start.py [--max-import-ms 150] [--max-first-request-ms 500]
+
+Exits non-zero when `import lambda_function` imports any of the lazily loaded dependencies, or
+when a limit is exceeded.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from common import SRC, percentiles
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+LAZY = ('msal', 'requests', 'cryptography', 'jwt', 'boto3', 'botocore', 'redis', 'jinja2', 'brotli', 'zstandard')
+
+CHILD = '''
+import json, sys
+from time import perf_counter
+sys.path.insert(0, %(benchmarks)r)
+import common, events, fakes
+t0 = perf_counter()
+import lambda_function
+t1 = perf_counter()
+import request_helper, session_dynamodb
+session_dynamodb.ddb = fakes.FakeDynamoDB()
+session_dynamodb.ddb.put_item(TableName='lambda_sessions', Item=events.session_item('benchmark'))
+request_helper.msal_http_client = fakes.FakeAuthority()
+request_helper.MSAL_DISCOVERY_CACHE_PATH = None  # keep the fake's documents out of the real cache
+before = set(sys.modules)
+e = events.event(%(path)r, cookies=%(cookies)r, query=%(query)r)
+t2 = perf_counter()
+r = lambda_function.lambda_handler(e, events.Context())
+t3 = perf_counter()
+lazy = sorted({m.split('.')[0] for m in set(sys.modules) - before} & set(%(lazy)r))
+print(json.dumps({"import": (t1 - t0) * 1000, "first": (t3 - t2) * 1000, "status": r["statusCode"], "imported": lazy}))
+'''
+
+ROUTES = {
+    # route: (path, cookies, query)
+    'favicon': ('/favicon.ico', None, None),
+    'logout': ('/auth/logout', None, None),
+    'login': ('/auth/login', None, None),
+    'static': ('/static/stylesheet.css', {'session': 'benchmark'}, None),
+    'view': ('/', {'session': 'benchmark'}, None),
+    '404': ('/does/not/exist', {'session': 'benchmark'}, None),
+    'logout callback': ('/auth/logout/callback', {'session': 'other'}, {'sid': 'none'}),
+}
+
+
+def env():
+    return {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+
+
+def importtime():
+    """ returns {top level package: self time ms} and the total ms """
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import sys; sys.path.insert(0, {BENCHMARKS!r}); import common; import lambda_function"],
+                         cwd=SRC, env=env(), capture_output=True, text=True, check=True).stderr
+    packages, total = {}, 0.0
+    for line in out.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():  # header
+            continue
+        name = name.strip()
+        top = name.split('.')[0]
+        packages[top] = packages.get(top, 0.0) + int(self_us) / 1000
+        if name == 'lambda_function':
+            total = int(cumulative_us) / 1000
+    return packages, total
+
+
+def first_requests(samples: int):
+    results = {}
+    for route, (path, cookies, query) in ROUTES.items():
+        code = CHILD % {'benchmarks': BENCHMARKS, 'path': path, 'cookies': cookies, 'query': query, 'lazy': LAZY}
+        runs = []
+        for _ in range(samples):
+            out = subprocess.run([sys.executable, '-c', code], cwd=SRC, env=env(), capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+        results[route] = runs
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=5)
+    parser.add_argument('--top', type=int, default=12)
+    parser.add_argument('--max-import-ms', type=float, default=None)
+    parser.add_argument('--max-first-request-ms', type=float, default=None)
+    args = parser.parse_args()
+    failures = []
+
+    packages, total = importtime()
+    print(f"import lambda_function: {total:.1f} ms (self time by top level package)")
+    for name, ms in sorted(packages.items(), key=lambda x: -x[1])[:args.top]:
+        print(f"  {name:<24} {ms:>8.2f} ms")
+    eager = sorted(set(packages) & set(LAZY))
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    if args.max_import_ms is not None and total > args.max_import_ms:
+        failures.append(f"import took {total:.1f} ms > {args.max_import_ms} ms")
+
+    print(f"\n{'route':<16} {'status':>6} {'import p50':>11} {'first p50':>10} {'first p95':>10}  imported on first request")
+    for route, runs in first_requests(args.samples).items():
+        imp, _, _ = percentiles([r['import'] for r in runs])
+        p50, p95, _ = percentiles([r['first'] for r in runs])
+        print(f"{route:<16} {runs[0]['status']:>6} {imp:>11.1f} {p50:>10.1f} {p95:>10.1f}  {', '.join(runs[0]['imported']) or '-'}")
+        if args.max_first_request_ms is not None and p50 > args.max_first_request_ms:
+            failures.append(f"first {route} request took {p50:.1f} ms > {args.max_first_request_ms} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
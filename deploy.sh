@@ -23,6 +23,10 @@ mkdir -p {deploy,package}
 
 pip install -t ./package -r requirements.txt
 
+# precompile the jinja templates into the package (use the same python version as the lambda runtime)
+# with the dependencies just installed into ./package on the path, as the build host may not have them
+(cd src || exit 1; PYTHONPATH=../package python response_helper.py)
+
 (cd package || exit 1; zip -r9 ".${PACKAGE_NAME}" .)
 (cd src || exit 1; zip -rg ".${PACKAGE_NAME}" .)
 
@@ -39,6 +43,6 @@ sam deploy \
   --s3-prefix "${STACK_NAME}" \
   --confirm-changeset
 
-rm -rf {deploy,package}  # clean-up
+rm -rf {deploy,package} src/templates_compiled  # clean-up
 
 echo "Configure the AAD application Redirect URI, Logout URL and Home page URL with the HttpApiUrl."
@@ -0,0 +1,124 @@
+"""
+Content negotiated response compression.
+
+gzip is always available; brotli (`br`) and zstandard (`zstd`) are used when the `brotli` or
+`zstandard` packages are installed. Further encodings can be added with `register()`.
+"""
+import gzip
+from importlib.util import find_spec
+
+# content types worth compressing, matched by prefix. Anything else, notably formats that are
+# compressed already (images, fonts, archives), is sent as is since compressing again only costs CPU.
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/xml",
+    "application/xhtml+xml",
+    "application/rss+xml",
+    "application/javascript",
+    "application/x-javascript",
+    "application/manifest+json",
+    "image/svg+xml",
+    "image/x-icon",
+    "image/vnd.microsoft.icon",
+)
+
+# encoding: compress(content: bytes, level: int) -> bytes
+compressors = {
+    # no timestamp in the header, so the same content always compresses the same (and keeps its ETag)
+    'gzip': lambda content, level: gzip.compress(content, compresslevel=level, mtime=0),
+}
+# default levels, used when none is given for an encoding
+levels = {'gzip': 6, 'br': 5, 'zstd': 3}
+# server preference, to break ties between encodings the client accepts equally
+preference = ['br', 'zstd', 'gzip']
+
+# the optional libraries are imported when first used, not when this module is
+if find_spec('brotli') is not None:
+    def _brotli(content, level):
+        import brotli
+        return brotli.compress(content, quality=level)
+    compressors['br'] = _brotli
+
+if find_spec('zstandard') is not None:
+    def _zstd(content, level):
+        import zstandard
+        return zstandard.ZstdCompressor(level=level).compress(content)
+    compressors['zstd'] = _zstd
+
+
+def register(encoding: str, compress, level: int = None, prefer: bool = False):
+    """ adds an encoding, `compress(content: bytes, level: int) -> bytes` """
+    compressors[encoding] = compress
+    if level is not None:
+        levels[encoding] = level
+    if encoding in preference:
+        preference.remove(encoding)
+    if prefer: preference.insert(0, encoding)
+    else: preference.append(encoding)
+
+
+def is_compressible(content_type: str):
+    return content_type.split(';', 1)[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def parse_accept_encoding(header: str):
+    """ 'gzip;q=0.8, br, *;q=0' -> {'gzip': 0.8, 'br': 1.0, '*': 0.0} """
+    accepted = {}
+    for item in header.split(','):
+        coding, *params = item.strip().split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            k, _, v = param.strip().partition('=')
+            if k.strip().lower() == 'q':
+                try:
+                    q = min(max(float(v), 0.0), 1.0)
+                except ValueError:
+                    q = 0.0  # malformed, treat as not acceptable
+        accepted[coding] = q
+    if 'x-gzip' in accepted and 'gzip' not in accepted:  # RFC 9110 8.4.1.3
+        accepted['gzip'] = accepted['x-gzip']
+    return accepted
+
+
+def negotiate(accept_encoding: str, available=None):
+    """ returns the encoding to use, or None for identity """
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get('*')
+    best, best_q = None, 0.0
+    for encoding in preference:
+        if available is not None and encoding not in available:
+            continue
+        if encoding not in compressors:
+            continue
+        q = accepted.get(encoding, wildcard)
+        if q is not None and q > best_q:  # ties keep the earlier, preferred, encoding
+            best, best_q = encoding, q
+    if best is None:
+        return None
+    # a client may prefer identity over any compression
+    if accepted.get('identity', -1.0) > best_q:
+        return None
+    return best
+
+
+def compress(content: bytes, content_type: str, accept_encoding: str, min_size: int = 0, level: dict = None):
+    """ returns (encoding, body); encoding is None when the content is returned unchanged
+
+    :param min_size: bodies smaller than this are not worth the CPU or the base64 overhead
+    :param level: compression level by encoding, overriding `levels`
+    """
+    if not content or len(content) < min_size or not is_compressible(content_type):
+        return None, content
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return None, content
+    compressed = compressors[encoding](content, (level or {}).get(encoding, levels.get(encoding)))
+    if len(compressed) >= len(content):  # not worth the Content-Encoding
+        return None, content
+    return encoding, compressed
@@ -8,10 +8,59 @@ AUTHORITY = os.environ['AUTHORITY']
 CLIENT_ID = os.environ['CLIENT_ID']
 CLIENT_SECRET = os.environ['CLIENT_SECRET']
 SCOPE = []  # msal adds offline_access openid profile
+# authority discovery documents are cached in memory and, in Lambda, persisted here (None for memory only).
+# /tmp is private to a Lambda container, but shared with other users elsewhere (eg. wsgi.py on a host), where
+# a file planted there could point msal's token requests at another server.
+MSAL_DISCOVERY_CACHE_PATH = '/tmp/msal_discovery.json' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else None
+MSAL_DISCOVERY_CACHE_TTL = 86400  # seconds
+# access tokens returned by request_helper.get_access_token are kept in memory, per account and scopes, and
+# refreshed once they have less than ACCESS_TOKEN_REFRESH_MARGIN left
+ACCESS_TOKEN_CACHE_SIZE = 1000  # tokens
+ACCESS_TOKEN_REFRESH_MARGIN = 300  # seconds
 
 # session
+# where sessions are stored: 'dynamodb', 'redis' (needs the redis package) or 'memory' (this process only, for tests)
+SESSION_STORE = 'dynamodb'
 DYNAMODB_SESSIONS_TABLE = 'lambda_sessions'
+DYNAMODB_CLIENT_CONFIG = {  # botocore.config.Config options
+    'max_pool_connections': 10,
+    'tcp_keepalive': True,  # keeps the connection open between warm invocations
+    'connect_timeout': 2,  # seconds
+    'read_timeout': 5,  # seconds
+    'retries': {'max_attempts': 3, 'mode': 'standard'},
+}
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_CLIENT_CONFIG = {  # redis.Redis options
+    'max_connections': 10,
+    'socket_keepalive': True,
+    'socket_connect_timeout': 1,  # seconds
+    'socket_timeout': 1,  # seconds
+    'health_check_interval': 30,  # seconds, pings connections idle for longer before reusing them
+}
 SESSION_COOKIE_NAME = 'session'
+# sessions expire SESSION_TTL after they were last used. Using one extends it with a small
+# write, at most once per SESSION_REFRESH_INTERVAL, rather than rewriting the whole session.
+SESSION_TTL = 3600  # seconds
+SESSION_REFRESH_INTERVAL = 300  # seconds
+# optionally store session data as one compressed binary attribute: 'json+zlib', 'msgpack+zlib' (needs
+# msgpack), or None (the default) for a native DynamoDB map. Items in either form are read whatever this is
+# set to, but a release from before codecs can't read binary ones, so opting in rules out rolling back to it.
+SESSION_CODEC = None
+# 'store', or 'cookie' to keep sessions in an encrypted cookie and only use the SESSION_STORE for the token
+# cache and single-sign-out (see session_cookie.py). The cookie key is derived from SESSION_SECRET.
+SESSION_BACKEND = 'store'
+SESSION_SECRET = os.environ.get('SESSION_SECRET', CLIENT_SECRET)
+SESSION_COOKIE_MAX_SIZE = 3800  # bytes, larger sessions keep their data in the store
+SESSION_REVOCATIONS_SIZE = 10000  # signed out sids and sessions remembered by each container
+# optional warm-container cache of session items, saves a DDB read on repeat requests. A session deleted or
+# changed by another container, including by AAD single-sign-out, is still accepted for up to
+# SESSION_CACHE_TTL. 0 (the default) disables it, eg. 1000 to enable.
+SESSION_CACHE_SIZE = 0  # items
+SESSION_CACHE_TTL = 30  # seconds
+# GET responses of views which opt in with CACHE_TTL (see response_cache.py), kept in this container's
+# memory ('memory') or in the user's session ('session')
+RESPONSE_CACHE_STORE = 'memory'
+RESPONSE_CACHE_SIZE = 500  # responses, for 'memory'
 
 # URLs
 # - Register the base URL of this app in the AAD <app>/Branding/Home page URL,
@@ -22,9 +71,41 @@ LOGOUT_PATH = '/auth/logout'
 LOGOUT_CALLBACK = LOGOUT_PATH + "/callback"  # register URL + this path with oauth app as logout url
 LOGOUT_COMPLETE = LOGOUT_PATH + '/complete'
 
+# login - until AAD redirects back to LOGIN_CALLBACK, a login is kept in a signed cookie rather than
+# the session store (see login_state.py). Its key is derived from SESSION_SECRET.
+LOGIN_COOKIE_NAME = 'login'
+LOGIN_STATE_TTL = 600  # seconds the user has to log in to AAD
+# login attempts each client ip may make to a container: LOGIN_RATE_BURST at once, refilled at
+# LOGIN_RATE_LIMIT per minute, then a 429. 0 to disable. The ip is the one API Gateway saw, not
+# X-Forwarded-For, which the client chooses.
+LOGIN_RATE_LIMIT = 0
+LOGIN_RATE_BURST = 10
+LOGIN_RATE_LIMIT_SIZE = 10000  # client ips remembered by each container
+
+# request bodies - API Gateway limits payloads to 10MB
+MULTIPART_MAX_PART_SIZE = 10 * 1024 * 1024  # bytes
+MULTIPART_MAX_TOTAL_SIZE = 10 * 1024 * 1024  # bytes, after base64 decoding
+
+# metrics - one CloudWatch Embedded Metric Format log line per sampled request (cold starts are always sampled)
+METRICS_NAMESPACE = 'LambdaWebapp'
+METRICS_SAMPLE_RATE = 1.0  # 0.0 - 1.0
+
 # paths
 VIEWS_PATH = '/views'
 DEFAULT_VIEW = 'default'
 DEFAULT_FUNC = 'view'
 STATIC_PATH = '/static'
 TEMPLATES_PATH = '/templates'
+COMPILED_TEMPLATES_PATH = '/templates_compiled'  # built when packaging, see response_helper.compile_templates
+
+# compression
+# - bodies under COMPRESSION_MIN_SIZE gain little from compression and lose more to base64 encoding
+# - brotli (br) and zstd are offered when the brotli/zstandard packages are installed
+COMPRESSION_MIN_SIZE = 1024  # bytes
+COMPRESSION_LEVELS = {'gzip': 6, 'br': 5, 'zstd': 3}  # rendered per response, so favour speed
+STATIC_COMPRESSION_LEVELS = {'gzip': 9, 'br': 11, 'zstd': 19}  # compressed once per container
+
+# static files
+# - fingerprinted URLs (see response_helper.static_url) change with the content so can be cached forever
+STATIC_CACHE_CONTROL = 'no-cache'  # revalidated with the ETag
+STATIC_CACHE_CONTROL_FINGERPRINTED = 'private, max-age=31536000, immutable'
@@ -1,16 +1,54 @@
+import math
 from urllib.parse import quote_plus, unquote_plus
 from request_helper import *
 from response_helper import *
+import login_state
+import metrics
+from cache_helper import LRUCache
+from metrics import timer
+from rate_limit import TokenBucket
+from router import Router
+import session_dynamodb
+import session_redis
+from session_cookie import CookieSessionInterface, derive_key
 from session_dynamodb import DynamoDbSessionInterface
-from views import load_module
+from session_memory import MemorySessionInterface
+from session_redis import RedisSessionInterface
+
+# shared by all invocations served by this container
+session_cache = LRUCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL) if SESSION_CACHE_SIZE else None  # off unless configured
+router = Router(cwd + VIEWS_PATH)
+# cookie sessions only: sessions signed out in this container, kept until the store would catch them
+revocations = LRUCache(SESSION_REVOCATIONS_SIZE, SESSION_REFRESH_INTERVAL)
+session_key = derive_key(SESSION_SECRET)
+login_key = derive_key(SESSION_SECRET, b'login state')
+login_limiter = TokenBucket(LOGIN_RATE_LIMIT / 60, LOGIN_RATE_BURST, LOGIN_RATE_LIMIT_SIZE) if LOGIN_RATE_LIMIT else None
+session_dynamodb.client_config = DYNAMODB_CLIENT_CONFIG
+session_redis.client_config = REDIS_CLIENT_CONFIG
+
+
+def new_session():
+    """ the session interface for SESSION_STORE and SESSION_BACKEND """
+    if SESSION_STORE == 'redis':
+        session = RedisSessionInterface(REDIS_URL, codec=SESSION_CODEC)
+    elif SESSION_STORE == 'memory':
+        session = MemorySessionInterface()
+    else:
+        session = DynamoDbSessionInterface(DYNAMODB_SESSIONS_TABLE, cache=session_cache, codec=SESSION_CODEC)
+    if SESSION_BACKEND == 'cookie':
+        session = CookieSessionInterface(session, session_key, SESSION_COOKIE_NAME, SESSION_COOKIE_MAX_SIZE, revocations)
+    return session
 
 
 def lambda_handler(event, context):
     # create a response object with the RequestId assigned for request tracking
     response = {'id': context.aws_request_id}
+    session = None
+    metrics.begin(METRICS_NAMESPACE, METRICS_SAMPLE_RATE).add_properties(RequestId=context.aws_request_id)
     try:
         # parse the request
-        request = parse_request(event, context)
+        with timer('Parse'):
+            request = parse_request(event, context, parse_multipart=False)  # parsed below, once routed
         # print(request)  # may contain secret data
 
         # extract values
@@ -24,9 +62,11 @@ def lambda_handler(event, context):
 
         # add accept-encoding for compression decision later
         response['accept-encoding'] = request['headers'].get('accept-encoding', '')
+        # add if-none-match for conditional requests
+        response['if-none-match'] = request['headers'].get('if-none-match', '')
 
         # initialise a session
-        session = DynamoDbSessionInterface(DYNAMODB_SESSIONS_TABLE)
+        session = new_session()
 
         # auth path handlers
         if method == 'GET':
@@ -35,35 +75,49 @@ def lambda_handler(event, context):
                 return serve_file(response, '/static/favicon.ico')
 
             if path == LOGIN_PATH:
-                session.create({
+                retry_after = login_limiter.take(request['peer_ip']) if login_limiter else 0
+                if retry_after:
+                    metrics.put('LoginThrottled')
+                    return format_response(response, "Too Many Requests", headers={'Retry-After': str(math.ceil(retry_after))}, code=429)
+                # nothing is stored until the login completes, the state travels in a cookie
+                login = {
+                    'state': login_state.new_state(),
                     'source_ip': request['source_ip'],
                     'referer': unquote_plus(qs_data.get('referer', '/'))
-                }).save()
+                }
                 redirect_uri = request['url'] + LOGIN_CALLBACK
-                return redirect(response, build_auth_url(session.session_id, SCOPE, redirect_uri), headers={
-                    "Set-Cookie": f"{SESSION_COOKIE_NAME}={session.session_id};path=/;SameSite=Lax;Secure",
+                with timer('MSAL'):
+                    auth_url = build_auth_url(login['state'], SCOPE, redirect_uri)
+                return redirect(response, auth_url, headers={
+                    "Set-Cookie": f"{LOGIN_COOKIE_NAME}={login_state.encode(login, login_key)};Max-Age={LOGIN_STATE_TTL};path={LOGIN_CALLBACK};SameSite=Lax;Secure;HttpOnly"
                 })
 
             elif path == LOGIN_CALLBACK:
-                session.open(cookies.get(SESSION_COOKIE_NAME))
-                if qs_data.get('state') != session.session_id:  # possible session forgery
+                login = login_state.decode(cookies.get(LOGIN_COOKIE_NAME), login_key, LOGIN_STATE_TTL)
+                if login is None or qs_data.get('state') != login['state']:  # expired, or possible forgery
                     return redirect(response, LOGIN_PATH)
                 if "error" in qs_data:  # Authentication/Authorization failure
                     return format_response(response, render_template("auth_error.html", result=qs_data), code=401)
                 if qs_data.get('code'):
-                    cache = load_cache(session.data)
-                    result = build_msal_app(cache).acquire_token_by_authorization_code(
-                        qs_data['code'],
-                        scopes=SCOPE,  # Misspelled scope would cause an HTTP 400 error here
-                        redirect_uri=request['url'] + LOGIN_CALLBACK)
+                    session.create({'source_ip': login['source_ip'], 'referer': login['referer']})
+                    cache = load_cache(session)
+                    with timer('MSAL'):
+                        result = build_msal_app(cache).acquire_token_by_authorization_code(
+                            qs_data['code'],
+                            scopes=SCOPE,  # Misspelled scope would cause an HTTP 400 error here
+                            redirect_uri=request['url'] + LOGIN_CALLBACK)
                     if "error" in result:
                         return format_response(response, render_template("auth_error.html", result=result), code=401)
                     session.session_state = qs_data.get('session_state')  # used by AAD single-sign-out
                     session.data["user"] = result.get("id_token_claims")
-                    if cache.has_state_changed:
-                        session.data["token_cache"] = cache.serialize()
-                    session.save()
-                    return redirect(response, session.data.get('referer', '/'))
+                    save_cache(session, cache)
+                    get_account_id(session, cache)  # for get_access_token
+                    session.save(SESSION_TTL)
+                    redirect(response, session.data.get('referer', '/'))
+                    # the state is used, so the login cookie can go
+                    add_cookie(response, f"{LOGIN_COOKIE_NAME}=;Max-Age=0;path={LOGIN_CALLBACK};SameSite=Lax;Secure;HttpOnly",
+                               event.get('version', '1.0'))
+                    return response
                 # invalid callback, redirect to login
                 return redirect(response, LOGIN_PATH)
 
@@ -85,6 +139,8 @@ def lambda_handler(event, context):
 
         # simple authorisation test
         session.open(cookies.get(SESSION_COOKIE_NAME))
+        if session.data.get('user'):
+            session.touch(SESSION_TTL, SESSION_REFRESH_INTERVAL)  # sliding expiry
         if not session.data.get('user'):
             if request['querystring']: request['path'] += f"?{request['querystring']}"
             return redirect(response, f"{LOGIN_PATH}?referer={quote_plus(request['path'])}")
@@ -94,20 +150,17 @@ def lambda_handler(event, context):
             return serve_file(response, path)
 
         # path mapping to view
-        f = VIEWS_PATH
-        for p in path.split('/')[1:]:  # first is always blank
-            if not p: continue
-            f += '/' + p
-            if os.path.isdir(cwd + f):  # directories take precedence
-                continue
-            if os.path.isfile(cwd + f + '.py'):
-                return load_module(f, request, response, session)
-        else:
-            f += '/' + DEFAULT_VIEW
-            if os.path.isfile(cwd + f + '.py'):
-                return load_module(f, request, response, session)
-
-        return format_response(response, "Page Not Found", code=404)
+        route, params = router.resolve(path)
+        if route is None:
+            return format_response(response, "Page Not Found", code=404)
+        if not route.allows(method):
+            return format_response(response, "Method Not Allowed", headers={'Allow': ', '.join(sorted(route.methods))}, code=405)
+        request['path_params'] = params
+        if route.parse_multipart and not request['form_data']:
+            with timer('Parse'):
+                request['form_data'] = parse_multipart_form(request)
+        with timer('View'):
+            return route(request, response, session)
 
     except UserWarning as e:
         return format_response(response, str(e), code=400)
@@ -115,3 +168,13 @@ def lambda_handler(event, context):
     except Exception as e:
         print(str(e))
         return format_response(response, "An error occurred. Check the logs.", code=500)
+
+    finally:
+        # a new or changed session cookie, alongside any cookie the view sets, unless the response sets it already (eg. logout)
+        if session is not None and session.cookie_changed and 'headers' in response \
+                and not response['headers'].get('Set-Cookie', '').startswith(f"{SESSION_COOKIE_NAME}="):
+            add_cookie(response, f"{SESSION_COOKIE_NAME}={session.cookie_value()};path=/;SameSite=Lax;Secure", event.get('version', '1.0'))
+        metrics.put('RequestBytes', len(event.get('body') or ''), 'Bytes')
+        metrics.put('ResponseBytes', len(response.get('body') or ''), 'Bytes')
+        metrics.add_properties(Status=response.get('statusCode'))
+        metrics.emit()
@@ -0,0 +1,45 @@
+"""
+The state of a login in progress - the `state` nonce sent to AAD, the referer and source ip - kept
+in a short-lived signed cookie until AAD redirects the user back to LOGIN_CALLBACK. Only a
+completed login writes a session, so logins that are abandoned, or never meant to finish (crawlers,
+health checks, redirect loops), cost nothing in the session store.
+
+The cookie is signed, not encrypted: it only holds what the browser sent or was sent anyway.
+"""
+import hmac
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from hashlib import sha256
+from os import urandom
+from time import time
+
+
+def new_state():
+    """ the nonce AAD returns in the callback's `state` """
+    return urandom(32).hex()
+
+
+def _sign(payload: str, key: bytes):
+    return urlsafe_b64encode(hmac.new(key, payload.encode('ascii'), sha256).digest()).decode('ascii').rstrip('=')
+
+
+def encode(state: dict, key: bytes):
+    """ the cookie value for `state`, timestamped so it can expire """
+    payload = urlsafe_b64encode(json.dumps({**state, 'iat': int(time())}).encode('utf-8')).decode('ascii').rstrip('=')
+    return f"{payload}.{_sign(payload, key)}"
+
+
+def decode(value: str, key: bytes, max_age: int):
+    """ the state, or None when the cookie is missing, older than `max_age` seconds or not signed with `key` """
+    if not value or '.' not in value:
+        return None
+    payload, signature = value.rsplit('.', 1)
+    try:
+        if not hmac.compare_digest(signature.encode('utf-8'), _sign(payload, key).encode('ascii')):
+            return None
+        state = json.loads(urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (ValueError, UnicodeEncodeError):
+        return None
+    if not isinstance(state, dict) or int(time()) - state.get('iat', 0) > max_age:
+        return None
+    return state
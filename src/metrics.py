@@ -0,0 +1,120 @@
+"""
+Per-request timings emitted as one CloudWatch Embedded Metric Format (EMF) log line.
+
+CloudWatch turns the line into metrics without any API calls. The handler starts a request with
+`begin()` and writes it with `emit()`; in between, anything can record into the current request:
+
+    from metrics import timer, put
+
+    @timer('Graph')                 # as a decorator, recorded as GraphTime
+    def call_graph(): ...
+
+    with timer('Graph'):            # or a context manager
+        ...
+
+    put('Items', len(items))        # or a value
+
+Repeated timers and values with the same name are summed. Outside a request they do nothing.
+"""
+import json
+import os
+import random
+from contextlib import ContextDecorator
+from threading import local
+from time import perf_counter, time
+
+_local = local()
+_cold = True  # the first request in this container
+
+
+class Metrics:
+
+    def __init__(self, namespace: str, dimensions: dict, sampled: bool):
+        self.namespace = namespace
+        self.dimensions = dimensions
+        self.sampled = sampled
+        self.start = perf_counter()
+        self.values = {}  # name: [value, unit]
+        self.properties = {}
+
+    def put(self, name: str, value: float, unit: str = 'Count'):
+        if name in self.values:
+            self.values[name][0] += value
+        else:
+            self.values[name] = [value, unit]
+
+    def add_properties(self, **properties):
+        """ adds searchable, non metric, fields to the log line """
+        self.properties.update(properties)
+
+    def record(self):
+        self.put('Latency', (perf_counter() - self.start) * 1000, 'Milliseconds')
+        return {
+            '_aws': {
+                'Timestamp': int(time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [list(self.dimensions)],
+                    'Metrics': [{'Name': k, 'Unit': u} for k, (_, u) in self.values.items()],
+                }],
+            },
+            **self.dimensions,
+            **self.properties,
+            **{k: round(v, 3) if isinstance(v, float) else v for k, (v, _) in self.values.items()},
+        }
+
+
+def begin(namespace: str, sample_rate: float = 1.0, **dimensions):
+    """ starts recording a request. Cold starts are always sampled. """
+    global _cold
+    cold, _cold = _cold, False
+    if not dimensions:
+        dimensions = {'Function': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')}
+    m = Metrics(namespace, dimensions, sampled=cold or random.random() < sample_rate)
+    m.put('ColdStart', int(cold))
+    _local.metrics = m
+    return m
+
+
+def current():
+    return getattr(_local, 'metrics', None)
+
+
+def put(name: str, value: float = 1, unit: str = 'Count'):
+    m = current()
+    if m is not None:
+        m.put(name, value, unit)
+
+
+def add_properties(**properties):
+    m = current()
+    if m is not None:
+        m.add_properties(**properties)
+
+
+def emit():
+    """ writes the current request, if sampled, and ends it """
+    m = current()
+    _local.metrics = None
+    if m is not None and m.sampled:
+        print(json.dumps(m.record(), separators=(',', ':')))
+    return m
+
+
+class timer(ContextDecorator):
+    """ times a block, or every call of a function, into the current request as '<name>Time' """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = None
+
+    def _recreate_cm(self):
+        return timer(self.name)  # a decorated function may be re-entered, so time each call separately
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        put(f"{self.name}Time", (perf_counter() - self.start) * 1000, 'Milliseconds')
+        return False
@@ -0,0 +1,157 @@
+import json
+import os
+import stat
+from functools import partial
+from hashlib import sha256
+from threading import Lock, local
+from time import time
+from urllib.parse import urlencode
+
+# msal and requests (which pulls in cryptography etc.) are imported on first use, as most
+# requests never need them
+
+
+class TokenCacheProxy:
+    """ Stands in for the token cache of a long lived ConfidentialClientApplication.
+
+    msal binds `token_cache.add/remove_rt/update_rt` into its oauth2 client when the app is built,
+    so the cache can't simply be reassigned per request. This proxy forwards every call to the
+    cache assigned with `use()` for the current thread, which lets one app serve many users.
+    """
+
+    def __init__(self):
+        self._local = local()
+
+    def use(self, cache):
+        self._local.cache = cache
+        return cache
+
+    @property
+    def cache(self):
+        cache = getattr(self._local, 'cache', None)
+        if cache is None:
+            import msal
+            cache = self.use(msal.SerializableTokenCache())
+        return cache
+
+    def add(self, *args, **kwargs):
+        return self.cache.add(*args, **kwargs)
+
+    def remove_rt(self, *args, **kwargs):
+        return self.cache.remove_rt(*args, **kwargs)
+
+    def update_rt(self, *args, **kwargs):
+        return self.cache.update_rt(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+
+class CachedResponse:
+    """ the subset of requests.Response that msal reads from discovery responses """
+
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {'Content-Type': 'application/json'}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+
+class DiscoveryCachingHttpClient:
+    """ Wraps an msal http client so OIDC discovery documents are fetched once.
+
+    Authority construction requests the openid-configuration (and, for non well-known hosts, the
+    instance metadata) before msal can do anything. Successful responses are kept in memory and,
+    when `path` is given, persisted as JSON so a new container on the same host can reuse them.
+    Anything that isn't a discovery GET is passed straight through.
+    """
+    DISCOVERY_PATHS = ('/.well-known/openid-configuration', '/common/discovery/instance')
+
+    def __init__(self, http_client, path: str = None, ttl: int = 86400):
+        self.http_client = http_client
+        self.path = path
+        self.ttl = ttl
+        self._documents = None  # key: {'expires': <epoch>, 'status_code': <int>, 'text': <str>}
+        self._lock = Lock()
+
+    def _is_discovery(self, url: str):
+        return any(p in url for p in self.DISCOVERY_PATHS)
+
+    def _load(self):
+        if self._documents is None:
+            self._documents = {}
+            if self.path and self._is_trusted(self.path):
+                try:
+                    with open(self.path) as f:
+                        self._documents = json.load(f)
+                except (OSError, ValueError):
+                    pass  # corrupt or unreadable, refetch
+        return self._documents
+
+    @staticmethod
+    def _is_trusted(path: str):
+        """ only a regular file this process's user owns and nobody else can write, as its documents
+        decide where msal sends the client secret """
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return False
+        if not stat.S_ISREG(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            print(f"Ignoring discovery cache {path}, it's not a file only this user can write")
+            return False
+        return True
+
+    def _persist(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.{os.getpid()}"
+        try:
+            # created afresh, readable by this user only
+            with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+                json.dump(self._documents, f)
+            os.replace(tmp, self.path)  # atomic, so concurrent readers never see a partial file
+        except OSError as e:
+            print(f"Unable to persist discovery cache: {e}")
+
+    def get(self, url, params=None, **kwargs):
+        if not self._is_discovery(url):
+            return self.http_client.get(url, params=params, **kwargs)
+        key = sha256((url + '?' + urlencode(sorted((params or {}).items()))).encode('utf-8')).hexdigest()
+        with self._lock:
+            entry = self._load().get(key)
+            if entry and entry['expires'] > time():
+                return CachedResponse(entry['status_code'], entry['text'])
+        resp = self.http_client.get(url, params=params, **kwargs)
+        if resp.status_code == 200:
+            with self._lock:
+                self._load()[key] = {'expires': int(time()) + self.ttl, 'status_code': resp.status_code, 'text': resp.text}
+                self._persist()
+        return resp
+
+    def post(self, url, **kwargs):
+        return self.http_client.post(url, **kwargs)
+
+    def clear(self):
+        with self._lock:
+            self._documents = {}
+            if self.path and self._is_trusted(self.path):
+                os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self.http_client, name)
+
+
+def default_http_client(timeout: float = None):
+    # mirrors the client msal builds for itself when none is given
+    import requests
+    session = requests.Session()
+    if timeout:
+        session.request = partial(session.request, timeout=timeout)
+    return session
@@ -0,0 +1,95 @@
+"""
+A bytes based multipart/form-data parser (RFC 7578).
+
+Parts are found by searching the original body, and part contents are returned as memoryview
+slices of it, so binary uploads are kept intact and never copied.
+"""
+import re
+from urllib.parse import unquote
+
+BOUNDARY_RE = re.compile(r'boundary=("[^"]+"|[^;, ]+)', flags=re.IGNORECASE)
+
+
+class Part:
+    __slots__ = ('headers', 'disposition', 'name', 'filename', 'content_type', 'content')
+
+    def __init__(self, headers: dict, content: memoryview):
+        self.headers = headers  # lower case keys
+        self.disposition, params = parse_header(headers.get('content-disposition', ''))
+        self.name = params.get('name')
+        self.filename = params.get('filename')
+        if 'filename*' in params:  # RFC 5987, eg. filename*=UTF-8''%e2%82%ac.txt
+            charset, _, filename = params['filename*'].split("'", 2) if params['filename*'].count("'") >= 2 else ('', '', params['filename*'])
+            self.filename = unquote(filename, encoding=charset or 'utf-8', errors='replace')
+        self.content_type = headers.get('content-type', 'application/octet-stream' if self.filename is not None else 'text/plain')
+        self.content = content
+
+    def text(self, encoding: str = 'utf-8'):
+        return str(self.content, encoding, 'replace')
+
+    def __len__(self):
+        return len(self.content)
+
+    def __repr__(self):
+        return f"Part(name={self.name!r}, filename={self.filename!r}, content_type={self.content_type!r}, size={len(self)})"
+
+
+def parse_boundary(content_type: str):
+    m = BOUNDARY_RE.search(content_type)
+    return m.group(1).strip('" ').encode('latin-1') if m is not None else None
+
+
+def parse_header(value: str):
+    """ 'form-data; name="a;b"; filename=c.txt' -> ('form-data', {'name': 'a;b', 'filename': 'c.txt'}) """
+    value, params = value.strip(), {}
+    i = value.find(';')
+    if i < 0:
+        return value.lower(), params
+    main, rest = value[:i].strip().lower(), value[i + 1:]
+    for m in re.finditer(r'\s*([^=;\s]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)\s*;?', rest):
+        k, v = m.group(1).lower(), m.group(2).strip()
+        if v.startswith('"'):
+            v = re.sub(r'\\(.)', r'\1', v[1:-1])
+        params[k] = v
+    return main, params
+
+
+def iter_parts(body, boundary: bytes, max_part_size: int = None, max_total_size: int = None):
+    """ yields each Part of a multipart body as it is found
+
+    :param body: the whole body, bytes or a buffer supporting find()
+    :raises UserWarning: on a malformed body or when a size limit is exceeded
+    """
+    if max_total_size is not None and len(body) > max_total_size:
+        raise UserWarning(f"Request body exceeds {max_total_size} bytes")
+    view = memoryview(body)
+    delimiter = b'--' + boundary
+    pos = body.find(delimiter)
+    if pos < 0:
+        raise UserWarning("Multipart boundary not found")
+    while True:
+        pos += len(delimiter)
+        if body[pos:pos + 2] == b'--':  # close delimiter
+            return
+        eol = body.find(b'\r\n', pos)  # anything before the CRLF is transport padding
+        if eol < 0:
+            raise UserWarning("Malformed multipart body")
+        start = eol + 2
+        if body[start:start + 2] == b'\r\n':  # no headers
+            headers, content_start = {}, start + 2
+        else:
+            end = body.find(b'\r\n\r\n', start)
+            if end < 0:
+                raise UserWarning("Malformed multipart headers")
+            headers = {}
+            for line in bytes(view[start:end]).decode('utf-8', 'replace').split('\r\n'):
+                k, _, v = line.partition(':')
+                headers[k.strip().lower()] = v.strip()
+            content_start = end + 4
+        content_end = body.find(b'\r\n' + delimiter, content_start)
+        if content_end < 0:
+            raise UserWarning("Unterminated multipart body")
+        if max_part_size is not None and content_end - content_start > max_part_size:
+            raise UserWarning(f"Multipart part exceeds {max_part_size} bytes")
+        yield Part(headers, view[content_start:content_end])
+        pos = content_end + 2
@@ -0,0 +1,30 @@
+from threading import Lock
+from time import monotonic
+
+from cache_helper import LRUCache
+
+
+class TokenBucket:
+    """ Per key (eg. source ip) token buckets, held by this container.
+
+    Each key may make `burst` requests at once, refilled at `rate` requests per second. Buckets
+    are kept in an LRUCache of `maxsize` keys, and dropped once they would have refilled.
+    """
+
+    def __init__(self, rate: float, burst: int = 10, maxsize: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = LRUCache(maxsize, ttl=burst / rate)  # key: (tokens, when)
+        self._lock = Lock()
+
+    def take(self, key, now: float = None):
+        """ takes a token for `key`. Returns 0 when it had one, else the seconds until it will. """
+        now = monotonic() if now is None else now
+        with self._lock:
+            tokens, when = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - when) * self.rate)
+            if tokens < 1:
+                self._buckets.set(key, (tokens, now))
+                return (1 - tokens) / self.rate
+            self._buckets.set(key, (tokens - 1, now))
+            return 0
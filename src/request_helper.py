@@ -1,23 +1,70 @@
 import json
-import re
-from base64 import b64decode
+from binascii import a2b_base64
+from threading import Lock
 from urllib.parse import parse_qsl, urlencode
-import msal
 from config import *
-
-
-# MSAL functions
-def load_cache(data):
+import multipart
+from cache_helper import LRUCache
+from metrics import put, timer
+from msal_helper import DiscoveryCachingHttpClient, TokenCacheProxy, default_http_client
+
+# reused across invocations so authority discovery happens once per container
+_msal_app = None
+# (account, scopes): access token, see get_access_token
+access_tokens = LRUCache(ACCESS_TOKEN_CACHE_SIZE)
+# striped, so concurrent requests for the same token wait for one refresh rather than each making one
+_refresh_locks = [Lock() for _ in range(64)]
+# the http client msal uses, None for its default (requests). Set before first use to, for
+# example, talk to a fake authority.
+msal_http_client = None
+
+
+# MSAL functions - msal is imported on first use as most requests never need it
+def load_cache(session):
+    """ the msal token cache of a session. Takes the session, whose token cache is kept apart from its
+    data and fetched on first use. Passing `session.data`, as views did before, still works but only
+    finds a token cache the data holds itself, which an opened session moves out of it. """
+    import msal
     cache = msal.SerializableTokenCache()
-    if data.get("token_cache"):
-        cache.deserialize(data["token_cache"])
+    if isinstance(session, dict):
+        serialized = session.get('token_cache')
+    else:
+        serialized = session.get_token_cache()  # fetched from the session store on first use
+    if serialized:
+        cache.deserialize(serialized)
     return cache
 
 
+def save_cache(session, cache):
+    """ keeps the token cache, if msal changed it, in the session (or in `session.data`) for its next save """
+    if cache.has_state_changed:
+        if isinstance(session, dict):
+            session['token_cache'] = cache.serialize()
+        else:
+            session.set_token_cache(cache.serialize())
+
+
+def get_msal_app(http_client=None):
+    """ returns the container wide app, building it on first use (or when a new http_client is given) """
+    global _msal_app
+    if _msal_app is None or http_client is not None:
+        import msal
+        _msal_app = msal.ConfidentialClientApplication(
+            CLIENT_ID, authority=AUTHORITY, client_credential=CLIENT_SECRET,
+            http_client=DiscoveryCachingHttpClient(
+                http_client or msal_http_client or default_http_client(),
+                path=MSAL_DISCOVERY_CACHE_PATH, ttl=MSAL_DISCOVERY_CACHE_TTL),
+            token_cache=TokenCacheProxy())
+    return _msal_app
+
+
 def build_msal_app(cache=None):
-    return msal.ConfidentialClientApplication(
-        CLIENT_ID, authority=AUTHORITY,
-        client_credential=CLIENT_SECRET, token_cache=cache)
+    app = get_msal_app()
+    if cache is None:
+        import msal
+        cache = msal.SerializableTokenCache()
+    app.token_cache.use(cache)
+    return app
 
 
 def build_auth_url(state: str, scopes: list, redirect_uri: str):
@@ -25,8 +72,71 @@ def build_auth_url(state: str, scopes: list, redirect_uri: str):
         scopes, state=state, redirect_uri=redirect_uri)
 
 
+def get_account_id(session, cache=None):
+    """ sets the session's account_id, the msal home_account_id of the user in its token cache. Set at
+    login, it's the id msal knows the user by, which for guest users isn't their id token's oid.tid. """
+    if cache is None:
+        cache = load_cache(session)
+    with timer('MSAL'):
+        accounts = build_msal_app(cache).get_accounts()
+    if not accounts:
+        return None
+    # a session's token cache only holds the user who logged in with it
+    session.data['account_id'] = accounts[0].get('home_account_id')
+    return session.data['account_id']
+
+
+def get_access_token(session, scopes: list):
+    """ returns an access token for the logged in user, for calling an API such as Microsoft Graph,
+    or None when one can't be had without the user logging in again.
+
+    Tokens are kept in memory until ACCESS_TOKEN_REFRESH_MARGIN before they expire, so most calls
+    don't touch the token cache or the network. The token cache is only written back to the
+    session when MSAL changed it, eg. after using the refresh token.
+    """
+    if not session.data.get('user'):
+        return None
+    account_id = session.data.get('account_id')
+    if account_id is None:  # logged in before the account id was kept in the session
+        account_id = get_account_id(session)
+        if account_id is None:
+            return None
+        session.save(SESSION_TTL)
+    key = (account_id, tuple(sorted(s.lower() for s in scopes)))
+    token = access_tokens.get(key)
+    if token is not None:
+        put('AccessTokenCacheHit')
+        return token
+    with _refresh_locks[hash(key) % len(_refresh_locks)]:
+        token = access_tokens.get(key)  # refreshed while this request waited
+        if token is not None:
+            put('AccessTokenCacheHit')
+            return token
+        put('AccessTokenCacheMiss')
+        cache = load_cache(session)
+        with timer('MSAL'):
+            app = build_msal_app(cache)
+            accounts = [a for a in app.get_accounts() if a.get('home_account_id') == account_id]
+            result = app.acquire_token_silent(scopes, account=accounts[0]) if accounts else None
+            if result and int(result.get('expires_in', 0)) <= ACCESS_TOKEN_REFRESH_MARGIN:
+                # msal still had a token, but too close to expiry to keep
+                result = app.acquire_token_silent(scopes, account=accounts[0], force_refresh=True)
+        if cache.has_state_changed:
+            save_cache(session, cache)
+            session.save(SESSION_TTL)
+        if not result or 'access_token' not in result:
+            if result:
+                print(json.dumps({'Error': result.get('error'), 'Description': result.get('error_description')}))
+            return None
+        lifetime = int(result.get('expires_in', 0)) - ACCESS_TOKEN_REFRESH_MARGIN
+        if lifetime > 0:
+            access_tokens.set(key, result['access_token'], ttl=lifetime)
+        return result['access_token']
+
+
 # API functions
-def parse_request(event, context):
+def parse_request(event, context, parse_multipart: bool = True):
+    """ :param parse_multipart: False leaves a multipart/form-data body for parse_multipart_form(), or iter_parts() """
     # ref: https://docs.aws.amazon.com/apigateway/latest/developerguide/http-api-develop-integrations-lambda.html
 
     # assign request context
@@ -38,7 +148,7 @@ def parse_request(event, context):
     # build url
     url = f"{headers.get('x-forwarded-proto', 'https')}://{request['domainName']}:{headers.get('x-forwarded-port', 443)}"
 
-    # get source ip
+    # get source ip, as the client says. `peer_ip` (below) is the address API Gateway saw, which the client can't choose
     source_ip = headers.get('x-forwarded-for', '').split(',')[0].strip()  # Syntax: <client>, <proxy1>, <proxy2>
 
     # get version
@@ -51,13 +161,15 @@ def parse_request(event, context):
     if version == '1.0':
         path = event['path'] if not stage else event['path'].replace(f"/{stage}", '', 1) or '/'
         method = event['httpMethod']
-        cookies = {k: v for k, v in (c.strip().split('=', 1) for c in headers.get('cookie', '').split(';'))}
-        if not source_ip: source_ip = request['identity']['sourceIp']
+        cookies = {k: v for k, v in (c.strip().split('=', 1) for c in headers.get('cookie', '').split(';') if '=' in c)}
+        peer_ip = request['identity']['sourceIp']
+        if not source_ip: source_ip = peer_ip
     elif version == '2.0':
         path = event['rawPath'] if not stage else event['rawPath'].replace(f"/{stage}", '', 1) or '/'
         method = request['http']['method']
-        cookies = {k: v for k, v in (c.split('=', 1) for c in event.get('cookies', []))}
-        if not source_ip: source_ip = request['http']['sourceIp']
+        cookies = {k: v for k, v in (c.split('=', 1) for c in event.get('cookies', []) if '=' in c)}
+        peer_ip = request['http']['sourceIp']
+        if not source_ip: source_ip = peer_ip
     else:
         raise Exception(f"Unhandled version: {version}")
 
@@ -68,10 +180,10 @@ def parse_request(event, context):
 
     # get form data
     form_data = {}
-    if event.get('body') is not None:
-        body = event['body']
+    body = event.get('body')
+    if body is not None:
         if event.get('isBase64Encoded', False):
-            body = b64decode(body.encode('utf-8')).decode('utf-8')
+            body = a2b_base64(body)  # bytes, decoded from the str without an intermediate copy
         content_type = headers.get('content-type', '')
         # application/json
         if content_type.lower().startswith('application/json'):
@@ -81,35 +193,43 @@ def parse_request(event, context):
                 raise UserWarning(str(e))
         # x-www-form-urlencoded
         elif content_type.lower().startswith('application/x-www-form-urlencoded'):
+            if isinstance(body, bytes): body = body.decode('utf-8')
             form_data = {k: v for k, v in parse_qsl(body)}
         # multipart/form-data
-        elif content_type.lower().startswith('multipart/form-data'):
-            m = re.search(r'boundary=("[^"]+"|[^ ]+)', content_type, flags=re.IGNORECASE)
-            if m is not None:
-                boundary = m.group(1).strip('" ')
-                for b in ('\r\n' + body).split('\r\n--' + boundary):
-                    if not b or b.startswith('--'): continue
-                    h, c = b.split('\r\n' * 2, 1)  # boundary: header, content
-                    hk, hv = h.split(':', 1)  # header: key, value
-                    if not hk.lower().startswith('\r\ncontent-disposition'):
-                        continue
-                    if not hv.lstrip().lower().startswith('form-data'):
-                        continue
-                    lines = hv.split('\r\n')  # a file can have its content-type on the next line
-                    f = {k.strip().lower(): v.strip('" ') for k, v in (d.split('=', 1) for d in lines[0].split(';') if '=' in d)}
-                    if 'name' not in f:  # we need a name for the form item
-                        continue
-                    if 'filename' not in f:  # form field
-                        form_data[f['name']] = c
-                    else:
-                        ct = 'application/octet-stream'
-                        if len(lines) > 1 and lines[1].lower().startswith('content-type'):
-                            _, ct = lines[1].split(':', 1)
-                        form_data[f['name']] = {'filename': f['filename'], 'mimetype': ct.strip(), 'content': c}
+        elif parse_multipart:
+            form_data = parse_multipart_form({'headers': headers, 'body': body})
 
     return {
-        'event': event, 'stage': stage, 'source_ip': source_ip,
+        'event': event, 'stage': stage, 'source_ip': source_ip, 'peer_ip': peer_ip,
         'url': url, 'path': path, 'method': method, 'headers': headers,
         'cookies': cookies, 'form_data': form_data, 'query_data': query_data,
-        'querystring': querystring, 'id': context.aws_request_id
+        'querystring': querystring, 'body': body, 'id': context.aws_request_id
     }
+
+
+def parse_multipart_form(request: dict):
+    """ the fields of a multipart/form-data request, {} for any other """
+    form_data = {}
+    if not request['headers'].get('content-type', '').lower().startswith('multipart/form-data'):
+        return form_data
+    for part in iter_parts(request):
+        if part.disposition != 'form-data' or not part.name:  # we need a name for the form item
+            continue
+        if part.filename is None:  # form field
+            form_data[part.name] = part.text()
+        else:  # content is a memoryview of the body, use bytes(content) for a copy
+            form_data[part.name] = {'filename': part.filename, 'mimetype': part.content_type, 'content': part.content}
+    return form_data
+
+
+def iter_parts(request: dict):
+    """ lazily yields the multipart.Part's of a multipart/form-data request, for views that
+    stream uploads elsewhere rather than use request['form_data'] (see PARSE_MULTIPART in router.py) """
+    body = request['body']
+    if not body:
+        return
+    if isinstance(body, str): body = body.encode('utf-8')
+    boundary = multipart.parse_boundary(request['headers'].get('content-type', ''))
+    if boundary is None:
+        return
+    yield from multipart.iter_parts(body, boundary, MULTIPART_MAX_PART_SIZE, MULTIPART_MAX_TOTAL_SIZE)
@@ -0,0 +1,126 @@
+"""
+Opt-in caching of GET view responses, per user, path and query string.
+
+A view opts in with a module attribute or the decorator:
+
+    CACHE_TTL = 60  # seconds
+
+    @cache_response(ttl=60)
+    def view(request, response, session): ...
+
+Cached responses carry a weak ETag, so a browser revalidating with If-None-Match gets a 304
+without the view running. Only 200 responses are cached, and a POST, PUT, PATCH or DELETE to the
+same path drops the user's cached responses for it. Responses are kept in this container's memory, or in
+the user's session (RESPONSE_CACHE_STORE = 'session') to share them between containers at the
+cost of a session write per miss; keep those small.
+
+Hits and misses are recorded as the ResponseCacheHit and ResponseCacheMiss metrics.
+"""
+import json
+from hashlib import sha1
+from time import time
+
+import compression
+from cache_helper import LRUCache
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_STORE, SESSION_TTL
+from metrics import add_properties, put
+from response_helper import etag_matches
+
+# methods which may change what a GET returns, so drop the user's cached responses for the path
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# (user, path, query string, encoding): entry
+responses = LRUCache(RESPONSE_CACHE_SIZE)
+hits = 0
+misses = 0
+
+
+def cache_response(ttl: int = 60):
+    """ caches the view's GET responses for `ttl` seconds """
+    def decorator(view):
+        view.cache_ttl = ttl
+        return view
+    return decorator
+
+
+def _user(session):
+    return (session.data.get('user') or {}).get('oid') or session.session_id
+
+
+def _key(request, response, session):
+    # the body is compressed for the client, so a client accepting another encoding needs another entry
+    encoding = compression.negotiate(response.get('accept-encoding', '')) or 'identity'
+    return _user(session), request['path'], request['querystring'], encoding
+
+
+def _get(key: tuple, session):
+    if RESPONSE_CACHE_STORE == 'session':
+        entry = session.data.get('response_cache', {}).get(json.dumps(key[1:]))
+        return entry if entry and entry['expires'] > time() else None
+    return responses.get(key)
+
+
+def _set(key: tuple, entry: dict, ttl: int, session):
+    if RESPONSE_CACHE_STORE == 'session':
+        now = time()
+        cached = {k: v for k, v in session.data.get('response_cache', {}).items() if v['expires'] > now}
+        cached[json.dumps(key[1:])] = {**entry, 'expires': now + ttl}
+        session.data['response_cache'] = cached
+        session.save(SESSION_TTL)
+    else:
+        responses.set(key, entry, ttl=ttl)
+
+
+def invalidate(session, path: str = None):
+    """ drops the user's cached responses, for `path` or all of them """
+    if RESPONSE_CACHE_STORE == 'session':
+        cached = session.data.get('response_cache')
+        if cached:
+            session.data['response_cache'] = {k: v for k, v in cached.items() if path is not None and json.loads(k)[0] != path}
+            session.save(SESSION_TTL)
+        return
+    user = _user(session)
+    responses.pop_where(lambda e: e['user'] == user and (path is None or e['path'] == path))
+
+
+def serve(view, ttl: int, request, response, session):
+    """ answers from the cache when it can, otherwise runs the view and caches a 200 """
+    global hits, misses
+    if request['method'] != 'GET':
+        if request['method'] in UNSAFE_METHODS:
+            invalidate(session, request['path'])
+        return view(request, response, session)
+    key = _key(request, response, session)
+    entry = _get(key, session)
+    hit = entry is not None
+    if hit:
+        hits += 1
+        put('ResponseCacheHit')
+    else:
+        misses += 1
+        put('ResponseCacheMiss')
+        view(request, response, session)
+        if response.get('statusCode') != 200:
+            return response
+        body = response.get('body') or ''
+        headers = {k: v for k, v in response.get('headers', {}).items() if k.lower() != 'set-cookie'}
+        entry = {
+            'user': key[0],
+            'path': key[1],
+            'headers': headers,
+            'body': body,
+            'isBase64Encoded': response.get('isBase64Encoded', False),
+            'etag': f'W/"{sha1(body.encode("utf-8")).hexdigest()[:20]}"',
+        }
+        _set(key, entry, ttl, session)
+    add_properties(ResponseCacheHitRate=round(hits / (hits + misses), 4))  # for this container
+    headers = {**entry['headers'], 'ETag': entry['etag'], 'Cache-Control': 'private, no-cache'}
+    if etag_matches(response.get('if-none-match', ''), entry['etag']):
+        response.update({'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False})
+    elif hit:
+        response.update({'statusCode': 200, 'headers': headers, 'body': entry['body'], 'isBase64Encoded': entry['isBase64Encoded']})
+    else:
+        response['headers'] = {**response['headers'], 'ETag': entry['etag'], 'Cache-Control': 'private, no-cache'}
+    if hit or response['statusCode'] == 304:
+        print(json.dumps({'RequestId': response['id'], 'Status': response['statusCode'], 'Cache': 'hit' if hit else 'revalidated'}))
+    return response
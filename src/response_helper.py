@@ -1,16 +1,17 @@
 import datetime
 import decimal
-import gzip
 import json
 from base64 import b64encode
-from mimetypes import guess_type
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import compression
 from config import *
+from metrics import timer
+from static_assets import AssetManifest
 
-jinja = Environment(
-    loader=FileSystemLoader(cwd + TEMPLATES_PATH),
-    autoescape=select_autoescape(['html'])
-)
+# created on first use, so requests that never render a template don't pay for importing jinja2
+jinja = None
+
+# built on first use, then shared by all invocations served by this container
+_assets = None
 
 
 def json_serialize(o):
@@ -21,33 +22,68 @@ def json_serialize(o):
     return str(o)
 
 
+def get_jinja():
+    global jinja
+    if jinja is None:
+        from jinja2 import ChoiceLoader, Environment, FileSystemLoader, ModuleLoader, select_autoescape
+        # templates precompiled to python modules when packaging skip jinja's parse/compile on first use;
+        # any template missing from them is compiled from the templates directory as usual
+        jinja = Environment(
+            loader=ChoiceLoader([
+                ModuleLoader(cwd + COMPILED_TEMPLATES_PATH),
+                FileSystemLoader(cwd + TEMPLATES_PATH)
+            ]),
+            autoescape=select_autoescape(['html'])
+        )
+        jinja.globals['static_url'] = static_url
+    return jinja
+
+
+@timer('Render')
 def render_template(template: str, **params):
-    return jinja.get_template(template).render(params)
-
-
-def compress_content(content: bytes, content_type: str):
-    if content and content_type.startswith('text') or content_type in (
-            "application/json",
-            "application/xml",
-            "application/xhtml+xml",
-            "application/rss+xml",
-            "application/javascript",
-            "application/x-javascript",
-    ):
-        return gzip.compress(content)
+    return get_jinja().get_template(template).render(params)
+
+
+def compile_templates(target: str = cwd + COMPILED_TEMPLATES_PATH):
+    """ Compiles every template to a python module in `target`, for the ModuleLoader in get_jinja(). Run
+    when packaging (see deploy.sh) with the same python version as the lambda runtime, so the
+    .pyc files written alongside are picked up too. """
+    import compileall
+    import shutil
+    from jinja2 import Environment, FileSystemLoader
+    shutil.rmtree(target, ignore_errors=True)
+    env = Environment(loader=FileSystemLoader(cwd + TEMPLATES_PATH), autoescape=get_jinja().autoescape)
+    env.compile_templates(target, zip=None, ignore_errors=False, log_function=print)
+    compileall.compile_dir(target, quiet=1)
+
+
+def compress_content(content: bytes, content_type: str, encoding: str = 'gzip', level: int = None):
+    if content and compression.is_compressible(content_type):
+        if level is None: level = COMPRESSION_LEVELS.get(encoding, compression.levels.get(encoding))
+        return compression.compressors[encoding](content, level)
     return None
 
 
+def add_vary(headers: dict, value: str):
+    vary = [v.strip() for v in headers.get('Vary', '').split(',') if v.strip()]
+    if value.lower() not in (v.lower() for v in vary):
+        headers['Vary'] = ', '.join(vary + [value])
+
+
 def format_response(response: dict, body: str = '', is_base64_encoded: bool = False, headers: dict = None, code: int = 200):
     # response = {'id': <string>}
     if code == 204: body = ''  # no content
     if headers is None: headers = {}
     content_type = headers.get('Content-Type', 'text/html')
-    if 'gzip' in response.get('accept-encoding', ''):
-        gzipped = compress_content(body.encode('utf-8'), content_type)
-        if gzipped:
-            headers['Content-Encoding'] = 'gzip'
-            body = b64encode(gzipped).decode('utf-8')
+    if body and not is_base64_encoded and compression.is_compressible(content_type):
+        add_vary(headers, 'Accept-Encoding')
+        with timer('Compress'):
+            encoding, compressed = compression.compress(
+                body.encode('utf-8'), content_type, response.get('accept-encoding', ''),
+                min_size=COMPRESSION_MIN_SIZE, level=COMPRESSION_LEVELS)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            body = b64encode(compressed).decode('utf-8')
             content_type += '; charset=utf-8'
             is_base64_encoded = True
     response.update({
@@ -86,39 +122,80 @@ def redirect(response: dict, url: str, headers: dict = None, code: int = 302):
     )
 
 
+def add_cookie(response: dict, cookie: str, version: str = '2.0'):
+    """ sets another cookie, besides any Set-Cookie in the headers, for the event's payload `version` """
+    if version == '1.0':  # merged with the headers by API Gateway
+        response.setdefault('multiValueHeaders', {}).setdefault('Set-Cookie', []).append(cookie)
+    else:
+        response.setdefault('cookies', []).append(cookie)
+
+
+def get_assets():
+    global _assets
+    if _assets is None:
+        _assets = AssetManifest(cwd + STATIC_PATH, STATIC_PATH, compressors={
+            encoding: lambda c, t, e=encoding: compress_content(c, t, e, STATIC_COMPRESSION_LEVELS.get(e))
+            for encoding in compression.compressors
+        })
+    return _assets
+
+
+def static_url(path: str):
+    """ the fingerprinted URL of a static file, eg. static_url('/static/stylesheet.css') """
+    return get_assets().url(path)
+
+
+def etag_matches(if_none_match: str, etag: str):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # weak comparison, as required for If-None-Match
+    def opaque(tag): return tag[2:] if tag.startswith('W/') else tag
+    return opaque(etag) in (opaque(t.strip()) for t in if_none_match.split(','))
+
+
 def serve_file(response: dict, path: str):
     """ This is not designed for large files, which should be served from S3 with signed URL's. """
-    fullpath = cwd + path
-    if not os.path.isfile(fullpath):
+    asset, fingerprinted = get_assets().get(path)
+    if asset is None:
         return format_response(response, 'File Not Found', code=404)
     # Content Type
-    content_type, encoding = guess_type(fullpath)
-    if not content_type:
-        content_type = "application/octet-stream"
-    # Content Length
-    content_length = os.path.getsize(fullpath)  # bytes
-    # Content
-    with open(fullpath, 'rb') as f:
-        content = f.read()
+    content_type = asset.content_type
     # Compress
-    encoding_header = {}
-    if 'gzip' in response.get('accept-encoding', ''):
-        gzipped = compress_content(content, content_type)
-        if gzipped:
-            content = gzipped
-            content_type += f'; charset={encoding or "utf-8"}'
-            encoding_header = {'Content-Encoding': 'gzip'}
+    encoding = compression.negotiate(response.get('accept-encoding', ''), available=asset.encodings)
+    if encoding:
+        with timer('Compress'):  # only the first request for each variant compresses
+            if asset.variant(encoding) is None:  # compressed isn't smaller
+                encoding = None
+    if encoding and content_type.startswith('text/'):
+        content_type += '; charset=utf-8'
+    body, content_length = asset.variant(encoding)
+    headers = {
+        'Access-Control-Allow-Origin': "*",
+        'Content-Type': content_type,
+        'ETag': asset.etag(encoding),
+        'Cache-Control': STATIC_CACHE_CONTROL_FINGERPRINTED if fingerprinted else STATIC_CACHE_CONTROL,
+    }
+    if asset.encodings:
+        headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    # Not Modified
+    if etag_matches(response.get('if-none-match', ''), headers['ETag']):
+        response.update({'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False})
+        print(json.dumps({'RequestId': response['id'], 'Status': 304, 'File': asset.fullpath}))
+        return response
     # build response
     response.update({
         'statusCode': 200,
-        'headers': {
-            'Access-Control-Allow-Origin': "*",
-            'Content-Type': content_type,
-            'Content-Length': content_length,
-            **encoding_header
-        },
-        'body': b64encode(content).decode("utf-8"),
+        'headers': {**headers, 'Content-Length': content_length},  # bytes sent, after compression
+        'body': body,
         'isBase64Encoded': True
     })
-    print(json.dumps({'RequestId': response['id'], 'Status': 200, 'File': fullpath, 'Content-Type': content_type, 'Content-Length': content_length}))
+    print(json.dumps({'RequestId': response['id'], 'Status': 200, 'File': asset.fullpath, 'Content-Type': content_type, 'Content-Length': content_length}))
     return response
+
+
+if __name__ == '__main__':
+    compile_templates()
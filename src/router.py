@@ -0,0 +1,138 @@
+import os
+from importlib import import_module
+from config import DEFAULT_FUNC, DEFAULT_VIEW
+import response_cache
+
+
+class Route:
+    """ A view file, imported on first dispatch and kept for the life of the container.
+
+    A view can restrict the HTTP methods it answers by defining `METHODS = ['GET', ...]`, and have
+    its GET responses cached with `CACHE_TTL = <seconds>` or `@response_cache.cache_response(ttl)`.
+    A view which reads a multipart/form-data body itself with `request_helper.iter_parts(request)`
+    sets `PARSE_MULTIPART = False`, so it isn't parsed into request['form_data'] first.
+    """
+
+    def __init__(self, path: str):
+        self.path = path  # eg. '/views/users/_user_id_'
+        self.module = path.lstrip('/').replace('/', '.')
+        self._view = None
+        self._methods = None
+        self.cache_ttl = None
+        self._parse_multipart = True
+
+    def _load(self):
+        m = import_module(self.module)
+        self._view = getattr(m, DEFAULT_FUNC)
+        methods = getattr(m, 'METHODS', None)
+        self._methods = frozenset(x.upper() for x in methods) if methods else None
+        self.cache_ttl = getattr(m, 'CACHE_TTL', None) or getattr(self._view, 'cache_ttl', None)
+        self._parse_multipart = getattr(m, 'PARSE_MULTIPART', True)
+
+    @property
+    def view(self):
+        if self._view is None:
+            self._load()
+        return self._view
+
+    @property
+    def methods(self):
+        if self._view is None:
+            self._load()
+        return self._methods
+
+    @property
+    def parse_multipart(self):
+        if self._view is None:
+            self._load()
+        return self._parse_multipart
+
+    def allows(self, method: str):
+        return self.methods is None or method.upper() in self.methods
+
+    def __call__(self, request, response, session):
+        view = self.view
+        if self.cache_ttl:
+            return response_cache.serve(view, self.cache_ttl, request, response, session)
+        return view(request, response, session)
+
+    def __repr__(self):
+        return f"Route({self.path!r})"
+
+
+class Node:
+    __slots__ = ('dirs', 'files', 'param_dir', 'param_file')
+
+    def __init__(self):
+        self.dirs = {}  # segment: Node
+        self.files = {}  # segment: Route
+        self.param_dir = None  # (name, Node)
+        self.param_file = None  # (name, Route)
+
+
+def param_name(name: str):
+    """ '_user_id_' -> 'user_id', anything else -> None """
+    if len(name) > 2 and name.startswith('_') and name.endswith('_') and not name.startswith('__'):
+        return name[1:-1]
+    return None
+
+
+class Router:
+    """ Maps request paths to views using a trie built once from the views directory.
+
+    The rules are those of walking the directory on each request:
+        - a directory takes precedence over a file of the same name
+        - the first file matched handles the request, remaining segments are ignored
+        - when every segment is a directory, DEFAULT_VIEW in the last one handles the request
+    A file or directory named `_<name>_` matches any segment not otherwise matched, and the
+    segment is returned in the params as `<name>`, eg. 'views/users/_user_id_.py'.
+    """
+
+    def __init__(self, views_dir: str, package: str = None):
+        self.views_dir = views_dir.rstrip('/')
+        self.package = package if package is not None else '/' + os.path.basename(self.views_dir)
+        self.root = self._scan(self.views_dir, self.package)
+
+    def _scan(self, directory: str, path: str):
+        node = Node()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(('.', '__')):  # hidden, __init__.py, __pycache__
+                    continue
+                if entry.is_dir():
+                    child = self._scan(entry.path, f"{path}/{name}")
+                    p = param_name(name)
+                    if p: node.param_dir = (p, child)
+                    else: node.dirs[name] = child
+                elif name.endswith('.py'):
+                    name = name[:-3]
+                    route = Route(f"{path}/{name}")
+                    p = param_name(name)
+                    if p: node.param_file = (p, route)
+                    else: node.files[name] = route
+        return node
+
+    def resolve(self, path: str):
+        """ returns (Route, params) or (None, {}) when nothing matches """
+        node, params = self.root, {}
+        for p in path.split('/'):
+            if not p: continue
+            child = node.dirs.get(p)
+            if child is not None:  # directories take precedence
+                node = child
+                continue
+            route = node.files.get(p)
+            if route is not None:
+                return route, params
+            if node.param_dir is not None:
+                name, node = node.param_dir
+                params[name] = p
+                continue
+            if node.param_file is not None:
+                name, route = node.param_file
+                params[name] = p
+                return route, params
+            return None, {}
+        route = node.files.get(DEFAULT_VIEW)
+        return (route, params) if route is not None else (None, {})
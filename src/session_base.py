@@ -0,0 +1,145 @@
+"""
+What every session store shares: the session's state, dirty tracking and sliding expiry.
+
+A store subclasses SessionInterface and implements
+    open(session_id)                    load the session, or create() one when there isn't one
+    _write(now, ttl)                    store the whole session, and the token cache if token_cache_changed
+    _refresh(now, ttl) -> bool          extend the ttl only, False when the session no longer exists
+    get_token_cache()                   fetch the token cache when not token_cache_loaded
+    delete(session_id), delete_sid(sid)
+"""
+import datetime
+import decimal
+import json
+import zlib
+from os import urandom
+from time import time
+
+from metrics import put, timer
+
+
+class SessionInterface:
+
+    def __init__(self):
+        self.clear()
+
+    def _json_serialize(self, o):
+        if isinstance(o, (datetime.date, datetime.datetime)):
+            return o.isoformat()
+        if isinstance(o, decimal.Decimal):
+            return float(o)
+        return str(o)
+
+    def _generate_id(self):
+        # your session is only as secure as your cookie so make it long
+        return urandom(64).hex()
+
+    def _snapshot(self):
+        return self.session_state, json.dumps(self.data, sort_keys=True, default=self._json_serialize)
+
+    @property
+    def is_dirty(self):
+        """ True when the session is new or its sid, data or token cache changed since it was opened or saved """
+        return self.snapshot is None or self.token_cache_changed or self.snapshot != self._snapshot()
+
+    def _reset_token_cache(self):
+        self.token_cache = None
+        self.token_cache_loaded = True  # nothing stored yet, so nothing to fetch
+        self.token_cache_changed = False
+
+    @staticmethod
+    def _compress_token_cache(serialized: str):
+        return zlib.compress(serialized.encode('utf-8'))
+
+    @staticmethod
+    def _decompress_token_cache(compressed: bytes):
+        return zlib.decompress(compressed).decode('utf-8')
+
+    def clear(self):
+        self.session_id = None
+        self.session_state = 'null'
+        self.data = {}
+        self.modified = None
+        self.snapshot = None
+        self.cookie_changed = False
+        self._reset_token_cache()
+        return self
+
+    def create(self, data: dict = None):
+        if data is None: data = {}
+        self.session_id = self._generate_id()  # assigned to the users cookie
+        self.session_state = 'null'  # a reference to the users session in Azure
+        self.data = data
+        self.modified = None
+        self.snapshot = None
+        self.cookie_changed = False
+        self._reset_token_cache()
+        return self
+
+    def _opened(self, session_id: str, session_state: str, modified: int, data: dict):
+        """ sets the state of a session read from the store """
+        self.session_id = session_id
+        self.session_state = session_state
+        self.modified = modified
+        self.data = data
+        self.cookie_changed = False
+        self.token_cache = None
+        self.token_cache_loaded = False
+        self.token_cache_changed = False
+        if 'token_cache' in self.data:  # written before the token cache had its own attribute
+            self.set_token_cache(self.data.pop('token_cache'))
+        self.snapshot = self._snapshot()
+        return self
+
+    def cookie_value(self):
+        """ the session cookie's value. Sent when `cookie_changed`, which a new session is once saved. """
+        return self.session_id or ''
+
+    def save(self, ttl: int = 3600, refresh_interval: int = 0):
+        # only rewrite the whole session when something in it changed, otherwise just extend the ttl
+        if not self.is_dirty:
+            return self.touch(ttl, refresh_interval)
+        now = int(time())  # epoch
+        with timer('Session'):  # the store's time only, save and touch call each other
+            self._write(now, ttl)
+        if self.modified is None:  # first saved, so the browser doesn't have the id yet
+            self.cookie_changed = True
+        self.modified = now
+        self.token_cache_changed = False
+        self.snapshot = self._snapshot()
+        return self
+
+    def touch(self, ttl: int = 3600, refresh_interval: int = 300):
+        """ slides the expiry of an opened session to `ttl` from now, writing only ttl and modified.
+        Skipped when the session was modified within the last `refresh_interval` seconds. """
+        now = int(time())
+        if self.modified is None:
+            return self
+        if self.token_cache_changed:  # eg. a session in the old layout, rewrite it instead
+            return self.save(ttl)
+        if now - self.modified < refresh_interval:
+            return self
+        with timer('Session'):
+            refreshed = self._refresh(now, ttl)
+        if not refreshed:
+            # deleted by another container, eg. single-sign-out, since this one read it
+            return self.clear()
+        put('SessionRefresh')
+        self.modified = now
+        return self
+
+    def set_token_cache(self, serialized: str):
+        """ replaces the serialized MSAL token cache, written by the next save() """
+        self.token_cache = serialized
+        self.token_cache_loaded = True
+        self.token_cache_changed = True
+
+    def get(self):
+        return {
+            'id': self.session_id,
+            'sid': self.session_state,
+            'data': self.data
+        }
+
+    def __str__(self):
+        return json.dumps(self.get(), default=self._json_serialize)
@@ -0,0 +1,50 @@
+"""
+Encodes session data as one binary DynamoDB attribute instead of a native map.
+
+TypeSerializer writes a map attribute by attribute, which is slow for nested id token claims,
+pushes every number through Decimal and is billed on the verbose map encoding. The binary form
+is a version byte followed by the compressed payload:
+
+    1   zlib compressed JSON
+    2   zlib compressed msgpack, when the `msgpack` package is installed
+
+Sessions read either form, whatever codec they write, so the codec can be switched on (or
+changed) without migrating the table.
+"""
+import json
+import zlib
+from importlib.util import find_spec
+
+JSON_ZLIB = 1
+MSGPACK_ZLIB = 2
+
+# name, as set in config.SESSION_CODEC: version byte
+codecs = {'json+zlib': JSON_ZLIB}
+if find_spec('msgpack') is not None:
+    codecs['msgpack+zlib'] = MSGPACK_ZLIB
+
+
+def encode(data: dict, codec: str = 'json+zlib', level: int = 6, default=str):
+    """ `default` converts values the format can't, as for json.dumps """
+    version = codecs.get(codec)
+    if version == JSON_ZLIB:
+        payload = json.dumps(data, separators=(',', ':'), default=default).encode('utf-8')
+    elif version == MSGPACK_ZLIB:
+        import msgpack
+        payload = msgpack.packb(data, default=default)
+    else:
+        raise ValueError(f"Unknown session codec '{codec}', expected one of {', '.join(codecs)}")
+    # sessions are a few KB, so a 4KB window compresses as well as the default 32KB and the
+    # compressor allocates ~32KB rather than ~256KB
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 12, 5)
+    return bytes([version]) + compressor.compress(payload) + compressor.flush()
+
+
+def decode(blob: bytes):
+    version, payload = blob[0], zlib.decompress(memoryview(blob)[1:])
+    if version == JSON_ZLIB:
+        return json.loads(payload)
+    if version == MSGPACK_ZLIB:
+        import msgpack
+        return msgpack.unpackb(payload)
+    raise ValueError(f"Unknown session codec version {version}")
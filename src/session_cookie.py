@@ -0,0 +1,195 @@
+"""
+Sessions kept in an encrypted cookie, so authenticated requests don't need to read the session store.
+
+The cookie holds the session id, sid and data (the user's id token claims), encrypted and
+authenticated with AES-GCM. The store (DynamoDB by default) is still used for what can't live in a cookie:
+    - the MSAL token cache, fetched only when a request calls `load_cache(session)`
+    - single-sign-out. A logged in session is also saved to the store, and every
+      `refresh_interval` `touch()` checks it's still there (and extends its ttl) with one
+      conditional write. A sid AAD signs out, or a deleted session, is also kept in a local
+      revocation list so this container rejects it straight away.
+
+A cookie larger than `max_size` only carries the id and sid, and the data is read from the store.
+"""
+import hmac
+import json
+import zlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from hashlib import sha256
+from os import urandom
+from time import time
+
+import session_codec
+from cache_helper import LRUCache
+from metrics import put
+from session_base import SessionInterface
+
+VERSION = 1  # first byte of the cookie, so the format can change
+
+
+def derive_key(secret: str, purpose: bytes = b'session cookie'):
+    """ a 256 bit cookie key from a configured secret, a different one for each purpose """
+    return hmac.new(secret.encode('utf-8'), purpose, sha256).digest()
+
+
+class CookieSessionInterface:
+
+    def __init__(self, store: SessionInterface, key: bytes, cookie_name: str = 'session',
+                 max_size: int = 3800, revocations: LRUCache = None):
+        self.store = store
+        self.key = key
+        self.cookie_name = cookie_name  # authenticated with the content, so a cookie can't be replayed as another
+        self.max_size = max_size  # bytes, browsers allow ~4KB per cookie including its name and attributes
+        # sids and session ids revoked in this container, shared by requests so owned by the caller
+        self.revocations = revocations
+        self.clear()
+
+    def _aead(self):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        return AESGCM(self.key)
+
+    def _encrypt(self, payload: dict):
+        nonce = urandom(12)
+        sealed = self._aead().encrypt(nonce, session_codec.encode(payload, 'json+zlib'), self.cookie_name.encode('utf-8'))
+        return urlsafe_b64encode(bytes([VERSION]) + nonce + sealed).decode('ascii').rstrip('=')
+
+    def _decrypt(self, value: str):
+        """ the payload, or None when the cookie isn't one of ours or was tampered with """
+        from cryptography.exceptions import InvalidTag
+        try:
+            blob = urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            if blob[0] != VERSION:
+                return None
+            plain = self._aead().decrypt(blob[1:13], blob[13:], self.cookie_name.encode('utf-8'))
+            return session_codec.decode(plain)
+        except (InvalidTag, ValueError, IndexError, zlib.error):
+            return None
+
+    def _is_revoked(self, session_id: str, sid: str):
+        if self.revocations is None:
+            return False
+        return self.revocations.get(session_id) is not None or (sid != 'null' and self.revocations.get(sid) is not None)
+
+    def _revoke(self, *keys):
+        if self.revocations is not None:
+            for key in keys:
+                if key and key != 'null':
+                    self.revocations.set(key, True)
+
+    def _bind_store(self):
+        """ points the store's session at this one, for the token cache and writes """
+        self.store.clear()
+        self.store.session_id = self.session_id
+        self.store.session_state = self.session_state
+        self.store.data = self.data
+        self.store.modified = self.checked
+        self.store.token_cache_loaded = self.checked is None  # never saved, so nothing to fetch
+
+    def clear(self):
+        self.session_id = None
+        self.session_state = 'null'
+        self.data = {}
+        self.checked = None  # when the store last confirmed the session, None if never saved there
+        self.cookie = ''
+        self.cookie_changed = False
+        self.store.clear()
+        return self
+
+    def create(self, data: dict = None):
+        if data is None: data = {}
+        self.clear()
+        self.session_id = urandom(64).hex()
+        self.data = data
+        self._bind_store()
+        return self
+
+    def cookie_value(self):
+        return self.cookie
+
+    def open(self, value: str = None):
+        payload = self._decrypt(value) if value else None
+        if payload is None or payload['exp'] <= int(time()) or self._is_revoked(payload['id'], payload['sid']):
+            return self.create()
+        self.session_id = payload['id']
+        self.session_state = payload['sid']
+        self.checked = payload.get('checked')
+        self.cookie = value
+        self.cookie_changed = False
+        if payload.get('data') is None:  # too large for the cookie, so it was left in the store
+            self.store.open(self.session_id)
+            if self.store.session_id != self.session_id:
+                return self.create()
+            self.data = self.store.data
+        else:
+            self.data = payload['data']
+            put('SessionCookieHit')
+        self._bind_store()
+        return self
+
+    def _issue(self, ttl: int):
+        payload = {'id': self.session_id, 'sid': self.session_state, 'checked': self.checked,
+                   'exp': int(time()) + ttl, 'data': self.data}
+        cookie = self._encrypt(payload)
+        if len(self.cookie_name) + 1 + len(cookie) > self.max_size:
+            payload['data'] = None
+            cookie = self._encrypt(payload)
+        self.cookie = cookie
+        self.cookie_changed = True
+
+    def save(self, ttl: int = 3600, refresh_interval: int = 0):
+        # only a logged in session, or one with a token cache, needs the store
+        if self.session_state != 'null' or self.store.token_cache_changed or self.checked is not None:
+            self.store.session_state = self.session_state
+            self.store.data = self.data
+            self.store.save(ttl)
+            self.checked = self.store.modified
+        self._issue(ttl)
+        return self
+
+    def touch(self, ttl: int = 3600, refresh_interval: int = 300):
+        """ every `refresh_interval` confirms the session hasn't been deleted from the store, for
+        example by single-sign-out in another container, and slides both expiries """
+        if self.checked is None or int(time()) - self.checked < refresh_interval:
+            return self
+        self.store.touch(ttl, 0)
+        if self.store.session_id is None:  # deleted
+            self._revoke(self.session_id)
+            self.clear()
+            self.cookie_changed = True  # to clear the cookie
+            return self
+        self.checked = self.store.modified
+        self._issue(ttl)
+        return self
+
+    def get_token_cache(self):
+        return self.store.get_token_cache()
+
+    def set_token_cache(self, serialized: str):
+        self.store.set_token_cache(serialized)
+
+    def delete(self, value: str = None):
+        """ deletes the session, or the one in the cookie `value` """
+        session_id = self.session_id
+        if value:
+            payload = self._decrypt(value)
+            if payload is None:
+                return self.clear()
+            session_id = payload['id']
+        self._revoke(session_id)
+        if session_id:
+            self.store.delete(session_id)
+        return self.clear()
+
+    def delete_sid(self, sid: str):
+        self._revoke(sid)
+        return self.store.delete_sid(sid)
+
+    def get(self):
+        return {
+            'id': self.session_id,
+            'sid': self.session_state,
+            'data': self.data
+        }
+
+    def __str__(self):
+        return json.dumps(self.get(), default=self.store._json_serialize)
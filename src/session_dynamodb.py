@@ -7,117 +7,262 @@ aws dynamodb create-table --table-name lambda_sessions \
 aws dynamodb update-time-to-live --table-name lambda_sessions \
     --time-to-live-specification 'Enabled=true,AttributeName=ttl'
 """
-import datetime
-import decimal
-import json
-from os import urandom
-from time import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
 
-from boto3 import client
-from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+import session_codec
+from cache_helper import LRUCache
+from metrics import put, timer
+from session_base import SessionInterface
 
-serializer = TypeSerializer()
-deserializer = TypeDeserializer()
+# created on first use, so requests that never open a session don't pay for importing boto3
+ddb = None
+serializer = None
+deserializer = None
+# botocore.config.Config options for the client, eg. config.DYNAMODB_CLIENT_CONFIG. Set before first use.
+client_config = {}
 
-ddb = client('dynamodb')
 
+def get_ddb():
+    global ddb
+    if ddb is None:
+        from boto3 import client
+        from botocore.config import Config
+        ddb = client('dynamodb', config=Config(**client_config))
+    return ddb
 
-class DynamoDbSessionInterface:
 
-    def __init__(self, table: str = 'lambda_sessions', sid_index_name: str = 'sid-index'):
+def get_serializer():
+    global serializer
+    if serializer is None:
+        from boto3.dynamodb.types import TypeSerializer
+        serializer = TypeSerializer()
+    return serializer
+
+
+def get_deserializer():
+    global deserializer
+    if deserializer is None:
+        from boto3.dynamodb.types import TypeDeserializer
+        deserializer = TypeDeserializer()
+    return deserializer
+
+
+class DynamoDbSessionInterface(SessionInterface):
+    """
+    Each session is one item: id, sid, ttl, modified and data, plus the serialized MSAL token cache
+    in its own zlib compressed binary attribute, token_cache. open() leaves token_cache out, as most
+    requests only need data['user'], and get_token_cache() fetches it on first use.
+
+    Items written before the split kept the token cache in data['token_cache']; open() moves it out
+    and the next save() or touch() rewrites the item in the new layout.
+    """
+
+    BATCH_SIZE = 25  # the BatchWriteItem limit
+    ATTRIBUTES = ('id', 'sid', 'ttl', 'modified', 'data')  # read by open()
+
+    def __init__(self, table: str = 'lambda_sessions', sid_index_name: str = 'sid-index', cache: LRUCache = None,
+                 batch_workers: int = 4, batch_retries: int = 8, codec: str = None):
         self.table = table
         self.sid_index_name = sid_index_name
+        # writes data as one compressed binary attribute (see session_codec), None for a native map
+        self.codec = codec
+        # optional warm-container cache of raw items keyed by session id. It must outlive this
+        # object (which is created per request) so the caller owns it, usually at module level.
+        self.cache = cache
+        self.batch_workers = batch_workers  # concurrent BatchWriteItem requests when purging
+        self.batch_retries = batch_retries  # attempts at unprocessed items before giving up
+        super().__init__()
+
+    def _cache_get(self, session_id: str):
+        if self.cache is None:
+            return None
+        raw = self.cache.get(session_id)
+        if raw is not None and int(raw['ttl']['N']) <= int(time()):  # expired in DDB terms
+            self.cache.pop(session_id)
+            raw = None
+        put('SessionCacheHit' if raw is not None else 'SessionCacheMiss')
+        return raw
 
-    def _json_serialize(self, o):
-        if isinstance(o, (datetime.date, datetime.datetime)):
-            return o.isoformat()
-        if isinstance(o, decimal.Decimal):
-            return float(o)
-        return str(o)
-
-    def _generate_id(self):
-        # your session is only as secure as your cookie so make it long
-        return urandom(64).hex()
-
-    def clear(self):
-        self.session_id = None
-        self.session_state = 'null'
-        self.data = {}
-        return self
-
-    def create(self, data: dict = None):
-        if data is None: data = {}
-        self.session_id = self._generate_id()  # assigned to the users cookie
-        self.session_state = 'null'  # a reference to the users session in Azure
-        self.data = data
-        return self
+    def _cache_set(self, session_id: str, raw: dict):
+        if self.cache is None:
+            return
+        # never replace a newer version of the item with an older one
+        cached = self.cache.pop(session_id)
+        if cached is not None and int(cached['modified']['N']) > int(raw['modified']['N']):
+            raw = cached
+        self.cache.set(session_id, raw)
 
+    @timer('Session')
     def open(self, session_id: str = None):
         if session_id:
-            response = ddb.get_item(
-                TableName=self.table,
-                Key={"id": {"S": session_id}}
-            )
-            if 'Item' in response:
-                item = {k: deserializer.deserialize(v) for k, v in response['Item'].items()}
-                self.item = item
-                self.session_id = item['id']
-                self.session_state = item['sid']
-                self.data = item['data']
-                return self
+            raw = self._cache_get(session_id)
+            if raw is None:
+                response = get_ddb().get_item(
+                    TableName=self.table,
+                    Key={"id": {"S": session_id}},
+                    ProjectionExpression=', '.join(f"#{a}" for a in self.ATTRIBUTES),
+                    ExpressionAttributeNames={f"#{a}": a for a in self.ATTRIBUTES}  # ttl and data are reserved words
+                )
+                raw = response.get('Item')
+                if raw is not None:
+                    self._cache_set(session_id, raw)
+            if raw is not None:
+                # decode on every open so views can't mutate the cached copy
+                if 'B' in raw['data']:
+                    data = session_codec.decode(raw['data']['B'])
+                else:  # a native map, as written without a codec
+                    data = get_deserializer().deserialize(raw['data'])
+                return self._opened(raw['id']['S'], raw['sid']['S'], int(raw['modified']['N']), data)
         return self.create()
 
-    def save(self, ttl: int = 3600):
-        now = int(time())  # epoch
-        payload = {
-            'id': self.session_id,
-            'sid': self.session_state,
-            'modified': now,
-            'ttl': now + ttl,
-            'data': self.data
+    def _write(self, now: int, ttl: int):
+        raw = {
+            'sid': {'S': self.session_state or 'null'},
+            'modified': {'N': str(now)},
+            'ttl': {'N': str(now + ttl)},
+            'data': ({'B': session_codec.encode(self.data, self.codec, default=self._json_serialize)} if self.codec
+                     else get_serializer().serialize(self.data))
         }
-        ddb.put_item(
+        # an update rather than a put, so an unchanged token_cache isn't read just to write it back
+        updates = [f"#{k} = :{k}" for k in raw]
+        values = {f":{k}": v for k, v in raw.items()}
+        names = {f"#{k}": k for k in raw}
+        remove = ''
+        if self.token_cache_changed:
+            names['#token_cache'] = 'token_cache'
+            if self.token_cache:
+                updates.append('#token_cache = :token_cache')
+                values[':token_cache'] = {'B': self._compress_token_cache(self.token_cache)}
+            else:
+                remove = ' REMOVE #token_cache'
+        get_ddb().update_item(
             TableName=self.table,
-            Item={k: serializer.serialize(v) for k, v in payload.items()}
+            Key={"id": {"S": self.session_id}},
+            UpdateExpression='SET ' + ', '.join(updates) + remove,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
         )
-        return self
+        self._cache_set(self.session_id, {'id': {'S': self.session_id}, **raw})
+
+    @timer('Session')
+    def get_token_cache(self):
+        """ returns the serialized MSAL token cache, fetching it on first use """
+        if not self.token_cache_loaded:
+            response = get_ddb().get_item(
+                TableName=self.table,
+                Key={"id": {"S": self.session_id}},
+                ProjectionExpression='token_cache'
+            )
+            compressed = response.get('Item', {}).get('token_cache')
+            self.token_cache = self._decompress_token_cache(compressed['B']) if compressed else None
+            self.token_cache_loaded = True
+        return self.token_cache
 
+    def _refresh(self, now: int, ttl: int):
+        try:
+            get_ddb().update_item(
+                TableName=self.table,
+                Key={"id": {"S": self.session_id}},
+                UpdateExpression='SET #ttl = :ttl, modified = :now',
+                ConditionExpression='attribute_exists(id)',  # don't resurrect a deleted session
+                ExpressionAttributeNames={'#ttl': 'ttl'},
+                ExpressionAttributeValues={':ttl': {'N': str(now + ttl)}, ':now': {'N': str(now)}}
+            )
+        except get_ddb().exceptions.ConditionalCheckFailedException:
+            if self.cache is not None:
+                self.cache.pop(self.session_id)
+            return False
+        if self.cache is not None:
+            raw = self.cache.get(self.session_id)
+            if raw is not None:
+                self._cache_set(self.session_id, {**raw, 'ttl': {'N': str(now + ttl)}, 'modified': {'N': str(now)}})
+        return True
+
+    @timer('Session')
     def delete(self, session_id: str = None):
+        session_id = session_id or self.session_id
         if session_id:
-            ddb.delete_item(
+            get_ddb().delete_item(
                 TableName=self.table,
                 Key={"id": {"S": session_id}}
             )
-        elif self.session_id:
-            ddb.delete_item(
-                TableName=self.table,
-                Key={"id": {"S": self.session_id}}
-            )
+            if self.cache is not None:
+                self.cache.pop(session_id)
         return self.clear()
 
+    @timer('Session')
     def delete_sid(self, sid: str):
         # When a user signs out of Azure (Single-Sign-Out), Azure sends a request to this app to
         # remove the users session. The request contains the querystring '?sid=<string>' which
         # matches the value from '?session_state=<string>' sent by Azure when logging in to this app.
-        response = ddb.query(
-            TableName=self.table,
-            IndexName=self.sid_index_name,
-            KeyConditionExpression='sid=:sid',
-            ExpressionAttributeValues={":sid": {"S": sid}})
-        if response['Count'] > 0:
-            for item in response['Items']:
-                item = {k: deserializer.deserialize(v) for k, v in item.items()}
-                ddb.delete_item(
-                    TableName=self.table,
-                    Key={"id": {"S": item['id']}}
-                )
+        return self.purge([sid])
 
-    def get(self):
-        return {
-            'id': self.session_id,
-            'sid': self.session_state,
-            'data': self.data
-        }
+    def _query_sid(self, sid: str):
+        """ yields the id of every session with the sid, following the query pagination """
+        kwargs = {}
+        while True:
+            response = get_ddb().query(
+                TableName=self.table,
+                IndexName=self.sid_index_name,
+                KeyConditionExpression='sid=:sid',
+                ExpressionAttributeValues={":sid": {"S": sid}},
+                **kwargs)
+            for item in response.get('Items', []):
+                yield item['id']['S']
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _scan_expired(self, now: int):
+        """ yields the id of every session past its ttl which DynamoDB hasn't removed yet """
+        kwargs = {}
+        while True:
+            response = get_ddb().scan(
+                TableName=self.table,
+                ProjectionExpression='id',
+                FilterExpression='#ttl < :now',
+                ExpressionAttributeNames={'#ttl': 'ttl'},
+                ExpressionAttributeValues={':now': {'N': str(now)}},
+                **kwargs)
+            for item in response.get('Items', []):
+                yield item['id']['S']
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _batch_delete(self, session_ids: list):
+        """ deletes up to BATCH_SIZE sessions, retrying unprocessed items with exponential backoff """
+        request = {self.table: [{'DeleteRequest': {'Key': {'id': {'S': i}}}} for i in session_ids]}
+        for attempt in range(self.batch_retries):
+            response = get_ddb().batch_write_item(RequestItems=request)
+            request = response.get('UnprocessedItems') or {}
+            if not request:
+                return len(session_ids)
+            sleep(min(0.05 * 2 ** attempt, 2.0) * random.random())  # full jitter
+        raise Exception(f"Unable to delete {len(request[self.table])} sessions after {self.batch_retries} attempts")
+
+    def _delete_many(self, session_ids):
+        """ deletes the sessions in BatchWriteItem chunks, `batch_workers` chunks at a time """
+        session_ids = list(dict.fromkeys(session_ids))  # a batch can't contain the same key twice
+        if self.cache is not None:
+            for session_id in session_ids:
+                self.cache.pop(session_id)
+        chunks = [session_ids[i:i + self.BATCH_SIZE] for i in range(0, len(session_ids), self.BATCH_SIZE)]
+        if len(chunks) <= 1 or self.batch_workers <= 1:
+            return sum(self._batch_delete(c) for c in chunks)
+        with ThreadPoolExecutor(max_workers=min(self.batch_workers, len(chunks))) as executor:
+            return sum(executor.map(self._batch_delete, chunks))
+
+    def purge(self, sids: list):
+        """ deletes every session belonging to any of the sids, returns the number deleted """
+        if self.cache is not None:
+            wanted = set(sids)
+            self.cache.pop_where(lambda raw: raw['sid'].get('S') in wanted)
+        return self._delete_many(i for sid in sids for i in self._query_sid(sid))
 
-    def __str__(self):
-        return json.dumps(self.get(), default=self._json_serialize)
+    def sweep_expired(self, now: int = None):
+        """ deletes sessions past their ttl. DynamoDB's own TTL deletion can lag by up to 48 hours,
+        during which the expired items still cost storage and show up in queries. Returns the number deleted. """
+        return self._delete_many(self._scan_expired(now or int(time())))
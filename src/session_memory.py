@@ -0,0 +1,85 @@
+"""
+Sessions in this process's memory, for tests, benchmarks and running locally. Sessions are shared
+by every MemorySessionInterface in the process and lost when it exits.
+"""
+import json
+from threading import Lock
+from time import time
+
+from session_base import SessionInterface
+
+# session id: {'sid', 'modified', 'expires', 'data' (JSON), 'token_cache'}
+sessions = {}
+_lock = Lock()
+
+
+class MemorySessionInterface(SessionInterface):
+
+    def __init__(self, store: dict = None):
+        self.store = sessions if store is None else store
+        super().__init__()
+
+    def _get(self, session_id: str):
+        entry = self.store.get(session_id)
+        if entry is not None and entry['expires'] <= time():
+            self.store.pop(session_id, None)
+            entry = None
+        return entry
+
+    def open(self, session_id: str = None):
+        entry = self._get(session_id) if session_id else None
+        if entry is None:
+            return self.create()
+        # stored as JSON, so views can't change a session without saving it
+        return self._opened(session_id, entry['sid'], entry['modified'], json.loads(entry['data']))
+
+    def _write(self, now: int, ttl: int):
+        with _lock:
+            entry = self.store.get(self.session_id) or {'token_cache': None}
+            entry.update({
+                'sid': self.session_state or 'null',
+                'modified': now,
+                'expires': now + ttl,
+                'data': json.dumps(self.data, default=self._json_serialize),
+            })
+            if self.token_cache_changed:
+                entry['token_cache'] = self.token_cache
+            self.store[self.session_id] = entry
+
+    def _refresh(self, now: int, ttl: int):
+        with _lock:
+            entry = self._get(self.session_id)
+            if entry is None:
+                return False
+            entry['modified'], entry['expires'] = now, now + ttl
+            return True
+
+    def get_token_cache(self):
+        if not self.token_cache_loaded:
+            entry = self._get(self.session_id)
+            self.token_cache = entry['token_cache'] if entry else None
+            self.token_cache_loaded = True
+        return self.token_cache
+
+    def delete(self, session_id: str = None):
+        self.store.pop(session_id or self.session_id, None)
+        return self.clear()
+
+    def delete_sid(self, sid: str):
+        return self.purge([sid])
+
+    def purge(self, sids: list):
+        """ deletes every session belonging to any of the sids, returns the number deleted """
+        with _lock:
+            session_ids = [k for k, v in self.store.items() if v['sid'] in sids]
+            for session_id in session_ids:
+                del self.store[session_id]
+        return len(session_ids)
+
+    def sweep_expired(self, now: int = None):
+        now = now or time()
+        with _lock:
+            session_ids = [k for k, v in self.store.items() if v['expires'] <= now]
+            for session_id in session_ids:
+                del self.store[session_id]
+        return len(session_ids)
@@ -0,0 +1,133 @@
+"""
+Sessions in Redis (or ElastiCache for Redis), for sub-millisecond reads. Needs the `redis` package.
+
+Each session is a hash, expired by Redis after its ttl:
+    session:<id>        sid, modified, data (see session_codec) and token_cache (zlib compressed)
+    session-sid:<sid>   set of the ids of the sessions logged in with the sid, for single-sign-out
+
+A local server for trying it out: `docker run -p 6379:6379 redis` and REDIS_URL=redis://localhost:6379/0
+"""
+import session_codec
+from metrics import timer
+from session_base import SessionInterface
+
+# one client, and its connection pool, per url; created on first use
+clients = {}
+# redis.Redis options for new clients, eg. config.REDIS_CLIENT_CONFIG. Set before first use.
+client_config = {}
+
+# slides a session's expiry, and its sid set's, only if it still exists: checked and set in one atomic
+# step, so a session deleted meanwhile isn't recreated. KEYS: session[, sid set]  ARGV: ttl, modified
+REFRESH = """
+if redis.call('EXPIRE', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'modified', ARGV[2])
+if KEYS[2] then
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+end
+return 1
+"""
+# registered scripts, per url, run by their sha after the first call
+scripts = {}
+
+
+def get_redis(url: str):
+    if url not in clients:
+        import redis
+        clients[url] = redis.Redis.from_url(url, **client_config)
+    return clients[url]
+
+
+class RedisSessionInterface(SessionInterface):
+
+    def __init__(self, url: str = 'redis://localhost:6379/0', codec: str = 'json+zlib',
+                 prefix: str = 'session:', sid_prefix: str = 'session-sid:'):
+        self.url = url
+        self.codec = codec or 'json+zlib'  # Redis has no native map, so data is always encoded
+        self.prefix = prefix
+        self.sid_prefix = sid_prefix
+        super().__init__()
+
+    def _key(self, session_id: str):
+        return f"{self.prefix}{session_id}"
+
+    def _sid_key(self, sid: str):
+        return f"{self.sid_prefix}{sid}"
+
+    @timer('Session')
+    def open(self, session_id: str = None):
+        if session_id:
+            sid, modified, data = get_redis(self.url).hmget(self._key(session_id), 'sid', 'modified', 'data')
+            if data is not None:
+                return self._opened(session_id, sid.decode('utf-8'), int(modified), session_codec.decode(data))
+        return self.create()
+
+    def _write(self, now: int, ttl: int):
+        key = self._key(self.session_id)
+        fields = {
+            'sid': self.session_state or 'null',
+            'modified': now,
+            'data': session_codec.encode(self.data, self.codec, default=self._json_serialize),
+        }
+        pipe = get_redis(self.url).pipeline()  # one round trip, applied atomically
+        if self.token_cache_changed:
+            if self.token_cache:
+                fields['token_cache'] = self._compress_token_cache(self.token_cache)
+            else:
+                pipe.hdel(key, 'token_cache')
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, ttl)
+        if fields['sid'] != 'null':
+            pipe.sadd(self._sid_key(fields['sid']), self.session_id)
+            pipe.expire(self._sid_key(fields['sid']), ttl)
+        pipe.execute()
+
+    def _refresh(self, now: int, ttl: int):
+        if self.url not in scripts:
+            scripts[self.url] = get_redis(self.url).register_script(REFRESH)
+        keys = [self._key(self.session_id)]
+        if self.session_state != 'null':
+            keys.append(self._sid_key(self.session_state))
+        return bool(scripts[self.url](keys=keys, args=[ttl, now]))
+
+    @timer('Session')
+    def get_token_cache(self):
+        """ returns the serialized MSAL token cache, fetching it on first use """
+        if not self.token_cache_loaded:
+            compressed = get_redis(self.url).hget(self._key(self.session_id), 'token_cache')
+            self.token_cache = self._decompress_token_cache(compressed) if compressed else None
+            self.token_cache_loaded = True
+        return self.token_cache
+
+    @timer('Session')
+    def delete(self, session_id: str = None):
+        session_id = session_id or self.session_id
+        if session_id:
+            get_redis(self.url).delete(self._key(session_id))
+        return self.clear()
+
+    @timer('Session')
+    def delete_sid(self, sid: str):
+        # see DynamoDbSessionInterface.delete_sid
+        return self.purge([sid])
+
+    def purge(self, sids: list):
+        """ deletes every session belonging to any of the sids, returns the number deleted """
+        if not sids:
+            return 0
+        client = get_redis(self.url)
+        pipe = client.pipeline(transaction=False)
+        for sid in sids:
+            pipe.smembers(self._sid_key(sid))
+        session_ids = {i.decode('utf-8') for members in pipe.execute() for i in members}
+        pipe = client.pipeline(transaction=False)
+        if session_ids:
+            pipe.delete(*[self._key(i) for i in session_ids])
+        pipe.delete(*[self._sid_key(sid) for sid in sids])
+        results = pipe.execute()
+        return results[0] if session_ids else 0
+
+    def sweep_expired(self, now: int = None):
+        """ Redis removes expired sessions itself """
+        return 0
@@ -0,0 +1,94 @@
+import os
+import re
+from base64 import b64encode
+from hashlib import sha256
+from mimetypes import guess_type
+
+from compression import is_compressible
+
+FINGERPRINT_LENGTH = 12
+FINGERPRINT_RE = re.compile(r'^(?P<name>.+)\.(?P<fingerprint>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % FINGERPRINT_LENGTH)
+
+
+class Asset:
+    """ A static file and its encoded variants, served from memory.
+
+    Compressed variants are built the first time they are asked for, so a cold start only pays
+    for compressing the files it actually serves.
+    """
+
+    def __init__(self, fullpath: str, content: bytes, compressors: dict):
+        self.fullpath = fullpath
+        self.content_type = guess_type(fullpath)[0]
+        if not self.content_type:
+            self.content_type = "application/octet-stream"
+        self.hash = sha256(content).hexdigest()
+        self.fingerprint = self.hash[:FINGERPRINT_LENGTH]
+        self.content = content
+        self.compressors = compressors if is_compressible(self.content_type) else {}
+        self.variants = {None: self._variant(content)}  # encoding: (base64 body, content length) or None
+
+    @staticmethod
+    def _variant(content: bytes):
+        return b64encode(content).decode('utf-8'), len(content)
+
+    @property
+    def encodings(self):
+        """ the encodings this asset may be served with """
+        return [e for e in self.compressors if self.variants.get(e, True) is not None]
+
+    def variant(self, encoding: str = None):
+        """ returns (base64 body, content length), or None when that encoding isn't worth using """
+        if encoding not in self.variants:
+            compressed = self.compressors[encoding](self.content, self.content_type)
+            self.variants[encoding] = self._variant(compressed) if compressed and len(compressed) < len(self.content) else None
+        return self.variants[encoding]
+
+    def etag(self, encoding: str = None):
+        # strong ETags must differ between representations of the same resource
+        return f'"{self.hash}-{encoding}"' if encoding else f'"{self.hash}"'
+
+
+class AssetManifest:
+    """ An index of every file under `static_dir`, addressed by its URL path.
+
+    Files can also be requested by a fingerprinted URL ('/static/site.<hash>.css') which changes
+    whenever the content does, so responses for those can be cached by the browser indefinitely.
+    Use `url()` to build fingerprinted URLs for templates.
+    """
+
+    def __init__(self, static_dir: str, url_prefix: str, compressors: dict = None):
+        self.static_dir = static_dir.rstrip('/')
+        self.url_prefix = url_prefix.rstrip('/')
+        self.compressors = compressors or {}
+        self.assets = {}  # url path: Asset
+        for root, dirs, files in os.walk(self.static_dir):
+            for name in files:
+                fullpath = os.path.join(root, name)
+                with open(fullpath, 'rb') as f:
+                    content = f.read()
+                path = self.url_prefix + fullpath[len(self.static_dir):].replace(os.sep, '/')
+                self.assets[path] = Asset(fullpath, content, self.compressors)
+
+    def get(self, path: str):
+        """ returns (Asset, is_fingerprinted) or (None, False) """
+        asset = self.assets.get(path)
+        if asset is not None:
+            fingerprinted = False
+        else:
+            m = FINGERPRINT_RE.match(path)
+            if m is None:
+                return None, False
+            asset = self.assets.get(m.group('name') + m.group('ext'))
+            if asset is None:
+                return None, False
+            # an outdated fingerprint still gets the current content, just not cached forever
+            fingerprinted = asset.fingerprint == m.group('fingerprint')
+        return asset, fingerprinted
+
+    def url(self, path: str):
+        asset = self.assets.get(path)
+        if asset is None:
+            return path
+        name, ext = os.path.splitext(path)
+        return f"{name}.{asset.fingerprint}{ext}"
@@ -0,0 +1,162 @@
+"""
+Runs lambda_handler as a WSGI application, to serve the app from a container or a multi-core host,
+or to load test it locally with any HTTP load generator (ab, wrk, hey, locust...).
+
+Each HTTP request is translated into the API Gateway payload format 2.0 event the handler gets
+in Lambda, with a synthetic context, and the response dict back into HTTP, base64 bodies,
+Set-Cookie and Content-Encoding (gzip, br...) included. Like a Lambda container, each worker
+process serves one request at a time and keeps its warm state (routes, session cache, msal app,
+access tokens) between them.
+
+With gunicorn (`pip install gunicorn`), preloading the app so workers share its imports:
+
+    gunicorn --chdir src --workers 4 --preload wsgi:application
+
+Or with only the standard library, a pre-forking server of `--workers` processes:
+
+    python src/wsgi.py --port 8000 --workers 4 [--session-store memory] [--quiet]
+
+The app still needs AAD and its SESSION_STORE. A 'memory' store is per worker, so use it with
+one worker or expect users to log in again when their requests land on another.
+"""
+import os
+import sys
+from base64 import b64decode, b64encode
+from http import HTTPStatus
+from time import time
+from urllib.parse import parse_qsl
+from uuid import uuid4
+
+import lambda_function
+
+
+class Context:
+    """ the parts of the Lambda context the app uses """
+    function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+    memory_limit_in_mb = 0
+    timeout = 30  # seconds, as API Gateway would allow
+
+    def __init__(self):
+        self.aws_request_id = str(uuid4())
+        self.deadline = time() + self.timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time()) * 1000))
+
+
+def build_event(environ: dict):
+    """ the API Gateway payload format 2.0 event for a WSGI request """
+    headers = {}
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            headers[key[5:].replace('_', '-').lower()] = value
+    for key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+        if environ.get(key):
+            headers[key.replace('_', '-').lower()] = environ[key]
+    # API Gateway sends the cookies separately
+    cookies = [c.strip() for c in headers.pop('cookie', '').split(';') if c.strip()]
+    host = headers.get('host') or environ['SERVER_NAME']
+    domain = host.split(':')[0]
+    headers.setdefault('x-forwarded-proto', environ['wsgi.url_scheme'])
+    headers.setdefault('x-forwarded-port', host.rsplit(':', 1)[1] if ':' in host else environ['SERVER_PORT'])
+    # WSGI decodes the path as latin-1, undo that for the utf-8 path API Gateway would send
+    path = environ.get('PATH_INFO', '/').encode('latin-1').decode('utf-8', 'replace') or '/'
+    method = environ['REQUEST_METHOD']
+    querystring = environ.get('QUERY_STRING', '')
+    query = {}
+    for k, v in parse_qsl(querystring, keep_blank_values=True):
+        query[k] = f"{query[k]},{v}" if k in query else v  # as API Gateway joins repeated parameters
+    event = {
+        'version': '2.0', 'routeKey': '$default', 'rawPath': path, 'rawQueryString': querystring,
+        'headers': headers,
+        'requestContext': {
+            'accountId': 'local', 'apiId': 'local', 'domainName': domain,
+            'domainPrefix': domain.split('.')[0], 'requestId': str(uuid4()), 'routeKey': '$default',
+            'stage': '$default', 'timeEpoch': int(time() * 1000),
+            'http': {'method': method, 'path': path, 'protocol': environ.get('SERVER_PROTOCOL', 'HTTP/1.1'),
+                     'sourceIp': environ.get('REMOTE_ADDR', ''), 'userAgent': headers.get('user-agent', '')},
+        },
+        'isBase64Encoded': False,
+    }
+    if query:
+        event['queryStringParameters'] = query
+    if cookies:
+        event['cookies'] = cookies
+    length = int(environ.get('CONTENT_LENGTH') or 0)
+    if length:
+        event['body'] = b64encode(environ['wsgi.input'].read(length)).decode('ascii')
+        event['isBase64Encoded'] = True
+    return event
+
+
+def build_response(response: dict):
+    """ the status, headers and body of a lambda_handler response """
+    code = response.get('statusCode', 200)
+    try:
+        status = f"{code} {HTTPStatus(code).phrase}"
+    except ValueError:
+        status = f"{code} Unknown"
+    body = response.get('body') or ''
+    body = b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+    headers = [(k, str(v)) for k, v in (response.get('headers') or {}).items() if k.lower() != 'content-length']
+    for k, values in (response.get('multiValueHeaders') or {}).items():
+        headers.extend((k, str(v)) for v in values)
+    headers.extend(('Set-Cookie', c) for c in response.get('cookies') or [])
+    if code != 304:
+        headers.append(('Content-Length', str(len(body))))  # of the body as sent, after any compression
+    return status, headers, body
+
+
+def application(environ, start_response):
+    response = lambda_function.lambda_handler(build_event(environ), Context())
+    status, headers, body = build_response(response)
+    start_response(status, headers)
+    return [body]
+
+
+def serve(host: str = '127.0.0.1', port: int = 8000, workers: int = 0):
+    """ serves `application` from `workers` forked processes sharing one listening socket """
+    import signal
+    from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+    class RequestHandler(WSGIRequestHandler):
+        def log_message(self, *args):  # lambda_handler logs each request
+            pass
+
+    server = make_server(host, port, application, handler_class=RequestHandler)
+    workers = workers or os.cpu_count() or 1
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:  # worker
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    print(f"serving on http://{host}:{port} with {workers} workers", file=sys.stderr)
+    try:
+        for pid in pids:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in pids:
+            os.kill(pid, signal.SIGTERM)
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="serve the app over HTTP from pre-forked worker processes")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=0, help="processes, default one per cpu")
+    parser.add_argument('--session-store', choices=['dynamodb', 'redis', 'memory'], help="overrides SESSION_STORE")
+    parser.add_argument('--quiet', action='store_true', help="discard the request logs, eg. when load testing")
+    args = parser.parse_args()
+    if args.session_store:
+        lambda_function.SESSION_STORE = args.session_store
+    if args.quiet:
+        sys.stdout = open(os.devnull, 'w')
+    serve(args.host, args.port, args.workers)